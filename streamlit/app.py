@@ -1,18 +1,10 @@
 #main.py
 import streamlit as st
-from tabs import introduction, wildfires_data, weather_data, us_forests, modeling, conclusion
-from data_processing import process_data
-from data_visualization import visualize_data
+from tab_registry import TABS
+from data_provisioning import start_prefetch
 import base64
 
-TABS = {
-    introduction.sidebar_name: introduction,
-    wildfires_data.sidebar_name: wildfires_data,
-    weather_data.sidebar_name: weather_data,
-    us_forests.sidebar_name: us_forests,
-    modeling.sidebar_name: modeling,
-    conclusion.sidebar_name: conclusion
-}
+# Les onglets (et leurs dépendances lourdes) ne sont importés qu'à leur première sélection
 
 def get_base64_image(image_path):
     with open(image_path, "rb") as image_file:
@@ -25,6 +17,9 @@ def run():
                        initial_sidebar_state="expanded",
                        )
     
+    # Prélecture des jeux de données en arrière-plan dès le démarrage
+    start_prefetch()
+
     st.sidebar.image("assets/wildfire.png", use_column_width=True)
     # st.sidebar.image("/mount/src/wildfires_dst/streamlit/assets/wildfire.png",use_column_width=True,)
     
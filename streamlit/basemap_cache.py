@@ -0,0 +1,171 @@
+# basemap_cache.py
+import io
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+from data_provisioning import data_dir
+from disk_cache import DiskCache
+
+# Tuiles de fond de carte téléchargées une fois puis servies depuis le disque (1 Go au plus)
+tile_cache = DiskCache(os.path.join(data_dir, 'cache', 'tiles'), max_bytes=2**30, suffix='.png')
+# Cartes des forêts déjà dessinées (PNG), réutilisées tant que les données ne changent pas (200 Mo au plus)
+map_cache = DiskCache(os.path.join(data_dir, 'cache', 'forest_maps'), max_bytes=200 * 2**20, suffix='.png')
+
+TILE_TIMEOUT = 10
+# après un échec réseau, plus de téléchargement pendant ce délai (s) : tuiles absentes laissées vides
+OFFLINE_DELAY = 300
+MAX_ZOOM = 18
+
+_offline_until = 0.0
+_offline_lock = threading.Lock()
+
+
+def tile_provider():
+    # même fond que contextily par défaut (OpenStreetMap HOT)
+    import xyzservices.providers as xyz
+    return xyz.OpenStreetMap.HOT
+
+
+def fetch_tile(provider, z, x, y):
+    # tuile PNG depuis le cache disque, sinon téléchargée (None si indisponible)
+    global _offline_until
+    key = f"{provider.name}/{z}/{x}/{y}"
+    data = tile_cache.get(key)
+    if data is not None or time.time() < _offline_until:
+        return data
+    import requests
+    try:
+        response = requests.get(provider.build_url(x=x, y=y, z=z), timeout=TILE_TIMEOUT,
+                                headers={'user-agent': 'wildfires-dst'})
+        response.raise_for_status()
+    except requests.RequestException:
+        with _offline_lock:
+            _offline_until = time.time() + OFFLINE_DELAY
+        return None
+    tile_cache.put(key, response.content)
+    return response.content
+
+
+def auto_zoom(w, s, e, n, provider):
+    # même choix de niveau que contextily (zoom='auto')
+    zoom = min(np.ceil(np.log2(360 * 2.0 / (e - w))), np.ceil(np.log2(360 * 2.0 / (n - s))))
+    return int(min(zoom, provider.get('max_zoom', MAX_ZOOM)))
+
+
+def extent_tiles(w, s, e, n, zoom):
+    import mercantile
+    return list(mercantile.tiles(w, s, e, n, zooms=[zoom]))
+
+
+def basemap_image(w, s, e, n, provider=None, zoom=None):
+    # mosaïque des tuiles couvrant l'emprise (lon/lat) et son emprise en Web Mercator ;
+    # complete = False si des tuiles manquent (hors ligne et absentes du cache)
+    import mercantile
+    from PIL import Image
+    provider = provider or tile_provider()
+    zoom = zoom if zoom is not None else auto_zoom(w, s, e, n, provider)
+    tiles = extent_tiles(w, s, e, n, zoom)
+    arrays = []
+    for tile in tiles:
+        data = fetch_tile(provider, tile.z, tile.x, tile.y)
+        arrays.append(None if data is None else np.asarray(Image.open(io.BytesIO(data)).convert('RGBA')))
+    found = [array for array in arrays if array is not None]
+    if not found:
+        return None, None, False
+    h, w_px, d = found[0].shape
+    xs, ys = [tile.x for tile in tiles], [tile.y for tile in tiles]
+    img = np.zeros(((max(ys) - min(ys) + 1) * h, (max(xs) - min(xs) + 1) * w_px, d), dtype=np.uint8)
+    for tile, array in zip(tiles, arrays):
+        if array is not None:
+            row, col = tile.y - min(ys), tile.x - min(xs)
+            img[row * h:(row + 1) * h, col * w_px:(col + 1) * w_px] = array
+    left, top = mercantile.xy(*mercantile.ul(min(xs), min(ys), zoom))
+    right, bottom = mercantile.xy(*mercantile.ul(max(xs) + 1, max(ys) + 1, zoom))
+    return img, (left, right, bottom, top), len(found) == len(arrays)
+
+
+def add_basemap(ax, crs="EPSG:4269", provider=None):
+    # équivalent de contextily.add_basemap servi par le cache de tuiles ; True si le fond est complet
+    import contextily as cx
+    from rasterio.warp import transform_bounds
+    xmin, xmax, ymin, ymax = ax.axis()
+    w, s, e, n = transform_bounds(crs, "EPSG:4326", xmin, ymin, xmax, ymax)
+    img, extent, complete = basemap_image(w, s, e, n, provider)
+    if img is not None:
+        img, extent = cx.warp_tiles(img, extent, t_crs=crs)
+        ax.imshow(img, extent=extent, interpolation='bilinear', zorder=0)
+        ax.axis((xmin, xmax, ymin, ymax))
+    return complete
+
+
+def maps_version(store, station_index):
+    # cartes redessinées si les contours des forêts ou l'index des stations changent
+    return json.dumps([store.inputs, station_index.inputs], sort_keys=True)
+
+
+def render_forest_map(forest, store, station_index):
+    # carte de la forêt (aire étendue, aire stricte, stations météo) sur fond de carte, en PNG ;
+    # contours au niveau de détail adapté à l'emprise de la forêt
+    import geopandas as gpd
+    import pandas as pd
+    # figure matplotlib sans pyplot : pas d'état global partagé entre les sessions
+    from matplotlib.figure import Figure
+    gdf_forest = store.forest('forests', forest)
+    polygon_ori = gdf_forest['geometry']
+    polygon_ext = store.forest('forests_ext', forest)['geometry']
+    polygons = pd.concat([polygon_ext, polygon_ori])
+
+    proc = gdf_forest['PROCLAIMED'].to_string(index=False)
+    df_proc = station_index.stations_of(proc)
+    stations = gpd.GeoSeries(gpd.points_from_xy(df_proc['long'], df_proc['lat']), crs="EPSG:4269")
+
+    fig = Figure(figsize=(10, 10))
+    base = fig.subplots()
+    polygons.plot(ax=base, color=['greenyellow', 'green'])
+    complete = add_basemap(base, crs="EPSG:4269")
+    stations.plot(ax=base, marker='x', color='black', markersize=50)
+    base.set_title(forest)
+    base.axis('off')
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue(), complete
+
+
+def forest_map(forest, store, station_index, version):
+    # carte servie depuis le disque ; mise en cache seulement si le fond de carte est complet
+    key = json.dumps([forest, version])
+    data = map_cache.get(key)
+    if data is None:
+        data, complete = render_forest_map(forest, store, station_index)
+        if complete:
+            map_cache.put(key, data)
+    return data
+
+
+def seed():
+    # tuiles et cartes de toutes les forêts préparées à l'avance, pour un usage hors ligne
+    from forest_geodata import get_geometry_store, get_station_index, TOLERANCES
+    store = get_geometry_store()
+    station_index = get_station_index()
+    version = maps_version(store, station_index)
+    forests = sorted(store.level('forests', TOLERANCES[-1])['FORESTNAME'])
+    missing = []
+    for forest in forests:
+        forest_map(forest, store, station_index, version)
+        if map_cache.get(json.dumps([forest, version])) is None:
+            missing.append(forest)
+    return len(forests), missing
+
+
+if __name__ == "__main__":
+    # python basemap_cache.py seed
+    start = time.perf_counter()
+    count, missing = seed()
+    print(f"{count - len(missing)}/{count} cartes prêtes ; tuiles : {tile_cache.size() / 2**20:.0f} Mo, "
+          f"cartes : {map_cache.size() / 2**20:.0f} Mo ({time.perf_counter() - start:.1f} s)")
+    if missing:
+        print("Fond de carte incomplet (réseau indisponible ?) :", ', '.join(missing))
+    sys.exit(1 if missing else 0)
@@ -0,0 +1,90 @@
+# data_aggregation.py
+import os
+import numpy as np
+import pandas as pd
+from data_loading import cache_path_for, derived_parquet, load_wildfires, parquet_path_for
+from data_processing import DERIVED_COLUMNS
+
+# Dimensions et mesures du cube d'agrégats des feux de forêt
+CUBE_KEYS = ['FIRE_YEAR', 'MONTH', 'DAY_OF_WEEK', 'STATENAME', 'GACC_area', 'STAT_CAUSE_DESCR']
+# count : nombre de feux ; FIRE_SIZE_count : feux de surface connue (dénominateur de la surface moyenne)
+CUBE_MEASURES = ['count', 'FIRE_SIZE_count', 'FIRE_SIZE_sum']
+CUBE_SOURCE_COLUMNS = ['FIRE_YEAR', 'DISCO_DATE', 'STATENAME', 'GACC_area', 'STAT_CAUSE_DESCR', 'FIRE_SIZE']
+
+# Tailles de cellule (en degrés) de la grille de densité, une par niveau de zoom
+GRID_CELL_SIZES = [2.0, 1.0, 0.5, 0.25, 0.1]
+
+
+def build_cube(df):
+    # un seul passage sur le jeu complet : nombre de feux et surface cumulée par combinaison
+    derived = DERIVED_COLUMNS['wildfires']
+    keys = [df['FIRE_YEAR'],
+            derived['MONTH'](df).rename('MONTH'),
+            derived['DAY_OF_WEEK'](df).rename('DAY_OF_WEEK'),
+            df['STATENAME'],
+            df['GACC_area'],
+            df['STAT_CAUSE_DESCR']]
+    # surfaces cumulées en float64, quel que soit le type de la colonne source
+    cube = (df['FIRE_SIZE'].astype('float64').groupby(keys, observed=True, dropna=False)
+              .agg(['size', 'count', 'sum'])
+              .reset_index())
+    cube.columns = CUBE_KEYS + CUBE_MEASURES
+    return cube
+
+
+def cube_path_for(csv_path):
+    return cache_path_for(csv_path, '_cube')
+
+
+def load_cube(csv_path):
+    # (re)construire le cube si absent, plus ancien que les données sources ou d'un autre format
+    return derived_parquet(cube_path_for(csv_path), [csv_path, parquet_path_for(csv_path)],
+                           lambda: build_cube(load_wildfires(csv_path, columns=CUBE_SOURCE_COLUMNS)),
+                           valid=lambda schema: (schema.names == CUBE_KEYS + CUBE_MEASURES
+                                                 and schema.field('FIRE_SIZE_sum').type == 'double'))
+
+
+def build_density_grid(df, cell_sizes=GRID_CELL_SIZES):
+    # nombre de feux par cellule carrée lat/lon, pour chaque taille de cellule
+    lat = df['LATITUDE'].to_numpy(dtype='float64')
+    lon = df['LONGITUDE'].to_numpy(dtype='float64')
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    lat, lon = lat[valid], lon[valid]
+
+    grids = []
+    for size in cell_sizes:
+        cells = pd.DataFrame({'lat': (np.floor(lat / size) + 0.5) * size,
+                              'lon': (np.floor(lon / size) + 0.5) * size})
+        grid = cells.groupby(['lat', 'lon']).size().rename('count').reset_index()
+        grid['count'] = grid['count'].astype('int32')
+        grid.insert(0, 'cell_size', size)
+        grids.append(grid)
+    return pd.concat(grids, ignore_index=True)
+
+
+def grid_path_for(csv_path):
+    return cache_path_for(csv_path, '_grid')
+
+
+def load_density_grid(csv_path):
+    # (re)construire la grille si absente ou plus ancienne que les données sources
+    return derived_parquet(grid_path_for(csv_path), [csv_path, parquet_path_for(csv_path)],
+                           lambda: build_density_grid(load_wildfires(csv_path, columns=['LATITUDE', 'LONGITUDE'])))
+
+
+def rollup(cube, keys):
+    # ré-agrégation du cube sur un sous-ensemble de dimensions
+    return cube.groupby(keys, observed=True)[CUBE_MEASURES].sum()
+
+
+if __name__ == "__main__":
+    # python data_aggregation.py [data/wildfires15_db.csv]
+    import sys
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join('data', 'wildfires15_db.csv')
+    for path in [cube_path_for(csv_path), grid_path_for(csv_path)]:
+        if os.path.exists(path):
+            os.remove(path)
+    cube = load_cube(csv_path)
+    print(f"{cube_path_for(csv_path)} ok ({len(cube)} lignes)")
+    grid = load_density_grid(csv_path)
+    print(f"{grid_path_for(csv_path)} ok ({len(grid)} cellules)")
@@ -1,7 +1,15 @@
 # data_loading.py
+import glob
+import json
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_provisioning import file_digest
 #import geopandas as gpd
 
+cache_dir = os.path.join('data', 'cache')
+
 
 def load_df(file_path):
     data = pd.read_csv(file_path)
@@ -12,3 +20,108 @@ def load_df(file_path):
 #    data = gpd.read_file(file_path)
 #    return data
 
+
+# Schéma typé du jeu de données des feux de forêt (wildfires15_db.csv)
+WILDFIRES_SCHEMA = {
+    'categories': ['STAT_CAUSE_DESCR', 'FIRE_SIZE_CLASS', 'STATE', 'FIPS_NAME',
+                   'COUNTYNAME', 'STUSPS', 'STATENAME', 'GACC_area'],
+    'dates': ['DISCO_DATE'],
+    # coordonnées seules réduites : les surfaces (FIRE_SIZE) gardent leur précision pour les sommes et l'ANOVA
+    'float32': ['LATITUDE', 'LONGITUDE'],
+    # code de cause entier de 1 à 13, stocké en float dans le CSV
+    'int8': ['STAT_CAUSE_CODE'],
+}
+
+
+def optimize_dtypes(df, categories=(), dates=(), float32=(), int8=()):
+    # catégories pour les libellés répétés, dates réelles, numériques réduits
+    for col in df.columns:
+        if col in categories:
+            df[col] = df[col].astype('category')
+        elif col in dates:
+            df[col] = pd.to_datetime(df[col])
+        elif col in float32:
+            df[col] = df[col].astype('float32')
+        elif col in int8:
+            # entier nullable seulement si des valeurs manquent
+            df[col] = df[col].astype('Int8' if df[col].isna().any() else 'int8')
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def derived_parquet(path, sources, build, valid=None, columns=None):
+    # fichier parquet dérivé de fichiers sources : (re)construit s'il est absent, plus ancien qu'une source
+    # ou rejeté par valid(schéma), écrit à côté puis mis en place ; sinon relu (colonnes demandées seulement)
+    if (os.path.exists(path)
+            and all(os.path.getmtime(path) >= os.path.getmtime(source) for source in sources if os.path.exists(source))
+            and (valid is None or valid(pq.read_schema(path)))):
+        return pd.read_parquet(path, columns=columns)
+    data = build()
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return (table if columns is None else table.select(columns)).to_pandas()
+
+
+def csv_table(csv_path, schema):
+    # conversion unique du CSV vers une table colonnaire typée
+    df = pd.read_csv(csv_path, index_col=0)
+    df = optimize_dtypes(df, **schema)
+    # schéma enregistré dans les métadonnées : copie reconstruite si le schéma change
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.replace_schema_metadata({**table.schema.metadata, b'schema': schema_key(schema)})
+
+
+def schema_key(schema):
+    return json.dumps(schema, sort_keys=True).encode()
+
+
+def cache_path_for(csv_path, suffix=''):
+    # fichiers dérivés d'un jeu de données, dans le dossier cache à côté de lui (data/cache)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(csv_path), 'cache', f"{name}{suffix}.parquet")
+
+
+def parquet_path_for(csv_path):
+    return cache_path_for(csv_path)
+
+
+def load_wildfires(csv_path, columns=None):
+    # copie parquet typée, reconstruite si absente, plus ancienne que le CSV ou d'un autre schéma ;
+    # ne lire que les colonnes demandées par la vue
+    return derived_parquet(parquet_path_for(csv_path), [csv_path], lambda: csv_table(csv_path, WILDFIRES_SCHEMA),
+                           valid=lambda schema: (schema.metadata or {}).get(b'schema') == schema_key(WILDFIRES_SCHEMA),
+                           columns=columns)
+
+
+# Colonnes du jeu de données météo (weather_data-state-june24.csv.gz) utilisées par l'application
+WEATHER_COLUMNS = ['date', 'state', 'TMAX_mean', 'PRCP_mean']
+
+
+def load_weather(csv_path):
+    # copie parquet typée identifiée par l'empreinte du fichier source
+    name = os.path.basename(csv_path).split('.')[0]
+    parquet_path = os.path.join(cache_dir, f"{name}.{file_digest(csv_path)[:16]}.parquet")
+
+    def build():
+        df = pd.read_csv(csv_path, compression='gzip', usecols=WEATHER_COLUMNS,
+                         dtype={'state': 'category', 'TMAX_mean': 'float32', 'PRCP_mean': 'float32'})
+        df['date'] = pd.to_datetime(df['date'], format='%Y%m%d')
+        # supprimer les copies d'une version précédente du fichier source
+        for old_path in glob.glob(os.path.join(cache_dir, f"{name}.*.parquet")):
+            os.remove(old_path)
+        return df
+    return derived_parquet(parquet_path, [], build)
+
+
+if __name__ == "__main__":
+    # python data_loading.py [data/wildfires15_db.csv]
+    import sys
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join('data', 'wildfires15_db.csv')
+    if os.path.exists(parquet_path_for(csv_path)):
+        os.remove(parquet_path_for(csv_path))
+    load_wildfires(csv_path, columns=[])
+    print(f"{parquet_path_for(csv_path)} ok")
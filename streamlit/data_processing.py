@@ -1,8 +1,66 @@
 # data_processing.py
+import numpy as np
 import pandas as pd
 
 
 def process_data(data):
     data = data.dropna()
-    
+
     return data
+
+
+# Colonnes dérivées de chaque jeu de données, déclarées une seule fois
+DERIVED_COLUMNS = {
+    # entiers nullables : une date de découverte manquante donne <NA> au lieu d'une erreur
+    'wildfires': {
+        'MONTH': lambda df: df['DISCO_DATE'].dt.month.astype('Int8'),
+        'DAY_OF_WEEK': lambda df: df['DISCO_DATE'].dt.dayofweek.astype('Int8'),
+    },
+    'weather': {
+        'year': lambda df: df['date'].dt.year.astype('int16'),
+        'month': lambda df: df['date'].dt.month.astype('int8'),
+        'season': lambda df: (df['date'].dt.month % 12 // 3 + 1).astype('int8'),
+    },
+}
+
+
+def add_derived_columns(df, dataset):
+    for name, compute in DERIVED_COLUMNS[dataset].items():
+        df[name] = compute(df)
+    return df
+
+
+def read_only(array):
+    array = np.array(array, copy=True)
+    array.flags.writeable = False
+    return array
+
+
+def frozen_column(series):
+    # copie de la colonne sur des tableaux numpy en lecture seule (API publique uniquement)
+    values = series.array
+    if isinstance(values, pd.Categorical):
+        values = pd.Categorical.from_codes(read_only(values.codes), dtype=values.dtype)
+    elif isinstance(values, pd.arrays.IntegerArray):
+        values = pd.arrays.IntegerArray(read_only(values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0)),
+                                        read_only(values.isna()))
+    else:
+        values = read_only(series.to_numpy())
+    return pd.Series(values, index=series.index, name=series.name, copy=False)
+
+
+class FrozenFrame(pd.DataFrame):
+    # cadre partagé entre toutes les sessions : ni écriture en place ni ajout ou suppression de colonne ;
+    # les opérations (filtres, groupby, copy...) renvoient des DataFrame ordinaires
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def _refuse(self, *args, **kwargs):
+        raise TypeError("cadre partagé en lecture seule : travailler sur une copie (df.copy())")
+
+    __setitem__ = __delitem__ = insert = pop = _refuse
+
+
+def freeze(df):
+    return FrozenFrame({name: frozen_column(df[name]) for name in df.columns}, copy=False)
@@ -0,0 +1,341 @@
+# data_provisioning.py
+import hashlib
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+data_dir = r'data'
+manifest_path = os.path.join(data_dir, 'manifest.json')
+# Empreintes relevées au premier téléchargement des fichiers que le manifeste n'épingle pas encore
+pins_path = os.path.join(data_dir, 'cache', 'pins.json')
+
+# Miroir optionnel (URL http(s) ou dossier local) consulté avant les sources du manifeste
+MIRROR_ENV = 'WILDFIRES_DATA_MIRROR'
+
+CHUNK_SIZE = 1 << 20
+
+# États possibles d'un jeu de données
+MISSING, DOWNLOADING, VERIFYING, READY, ERROR = 'missing', 'downloading', 'verifying', 'ready', 'error'
+
+
+# Empreintes déjà calculées, par (chemin, taille, date de modification)
+_digests = {}
+
+
+def file_digest(path):
+    # sha256 du fichier, recalculé seulement si le fichier a changé
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        _digests[key] = sha.hexdigest()
+    return _digests[key]
+
+
+def range_digest(path, start, end):
+    # sha256 des octets [start, end) du fichier
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            sha.update(chunk)
+            remaining -= len(chunk)
+    return sha.hexdigest()
+
+
+def matches_digest(path, entry):
+    # fichier complété par ajouts successifs (registre des modèles) : empreinte du début du fichier
+    # puis une empreinte par segment ajouté, dans l'ordre ; sinon empreinte du fichier entier
+    appended = entry.get('appended', [])
+    if not appended:
+        return file_digest(path) == entry['sha256']
+    start = entry['size'] - sum(segment['size'] for segment in appended)
+    if range_digest(path, 0, start) != entry['sha256']:
+        return False
+    for segment in appended:
+        if range_digest(path, start, start + segment['size']) != segment['sha256']:
+            return False
+        start += segment['size']
+    return True
+
+
+def load_manifest(path=manifest_path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def registry_files(path):
+    # fichiers d'un jeu décrit par le registre des modèles (tailles et empreintes tenues à jour par les pipelines)
+    with open(path, encoding='utf-8') as f:
+        registry = json.load(f)
+    return [artifact for entry in registry['forests'].values() for artifact in entry['artifacts'].values()]
+
+
+class DataNotReady(Exception):
+    pass
+
+
+# --- Sources --------------------------------------------------------------
+
+class LocalDirSource:
+    # copie depuis un dossier local (ou monté), reprise à partir du fichier partiel
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, relpath, part_path, progress):
+        src = os.path.join(self.root, relpath)
+        total = os.path.getsize(src)
+        done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if done > total:
+            done = 0
+        with open(src, 'rb') as fin, open(part_path, 'ab' if done else 'wb') as fout:
+            fin.seek(done)
+            for chunk in iter(lambda: fin.read(CHUNK_SIZE), b''):
+                fout.write(chunk)
+                done += len(chunk)
+                progress(done, total)
+
+
+class HttpSource:
+    # téléchargement http(s) par blocs, reprise par en-tête Range
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = timeout
+
+    def fetch(self, relpath, part_path, progress):
+        url = self.base_url + urllib.request.pathname2url(relpath).lstrip('/')
+        done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = urllib.request.Request(url, headers={'Range': f'bytes={done}-'} if done else {})
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            # 416 : le fichier partiel est déjà complet
+            if e.code == 416 and done:
+                return
+            raise
+        with response:
+            if response.status != 206:
+                done = 0
+            length = response.headers.get('Content-Length')
+            total = done + int(length) if length is not None else None
+            with open(part_path, 'ab' if done else 'wb') as fout:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    fout.write(chunk)
+                    done += len(chunk)
+                    progress(done, total)
+
+
+class GDriveSource:
+    # fichier Google Drive (gdown gère lui-même la reprise)
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+    def fetch(self, relpath, part_path, progress):
+        import gdown
+        gdown.download(id=self.file_id, output=part_path, quiet=True, resume=True)
+
+
+def make_source(spec):
+    if spec['type'] == 'gdrive':
+        return GDriveSource(spec['id'])
+    if spec['type'] == 'http':
+        return HttpSource(spec['url'])
+    if spec['type'] == 'local':
+        return LocalDirSource(spec['path'])
+    raise ValueError(f"Type de source inconnu : {spec['type']}")
+
+
+def mirror_source(mirror=None):
+    mirror = mirror or os.environ.get(MIRROR_ENV)
+    if not mirror:
+        return None
+    if mirror.startswith(('http://', 'https://')):
+        return HttpSource(mirror)
+    return LocalDirSource(mirror)
+
+
+# --- Provisionnement --------------------------------------------------------
+
+class Provisioner:
+    def __init__(self, manifest, root=data_dir, mirror=None):
+        self.manifest = manifest
+        self.root = root
+        self.mirror = mirror_source(mirror)
+        self.pins_path = os.path.join(root, os.path.relpath(pins_path, data_dir))
+        self.pins = {}
+        if os.path.exists(self.pins_path):
+            with open(self.pins_path, encoding='utf-8') as f:
+                self.pins = json.load(f)
+        self.status = {name: {'state': MISSING, 'done': 0, 'total': None, 'error': None}
+                       for name in manifest['datasets']}
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def files(self, name):
+        dataset = self.manifest['datasets'][name]
+        if 'registry' in dataset:
+            return registry_files(os.path.join(self.root, dataset['registry']))
+        # empreinte relevée localement pour les fichiers non épinglés dans le manifeste
+        return [{**entry, **self.pins.get(entry['path'], {})} if entry.get('sha256') is None else entry
+                for entry in dataset['files']]
+
+    def pin(self, entry):
+        # première copie vérifiée d'un fichier non épinglé : taille et empreinte gardées pour les vérifications suivantes
+        path = os.path.join(self.root, entry['path'])
+        with self._lock:
+            self.pins[entry['path']] = {'size': os.path.getsize(path), 'sha256': file_digest(path)}
+            os.makedirs(os.path.dirname(self.pins_path), exist_ok=True)
+            tmp_path = self.pins_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.pins, f, indent=1)
+            os.replace(tmp_path, self.pins_path)
+
+    def path(self, name):
+        # chemin local du (premier) fichier d'un jeu de données
+        dataset = self.manifest['datasets'][name]
+        return os.path.join(self.root, dataset['registry'] if 'registry' in dataset else dataset['files'][0]['path'])
+
+    def _update(self, name, **values):
+        with self._lock:
+            self.status[name].update(values)
+
+    def verify(self, entry):
+        path = os.path.join(self.root, entry['path'])
+        if not os.path.exists(path):
+            return False
+        if entry.get('size') is not None and os.path.getsize(path) != entry['size']:
+            return False
+        return entry.get('sha256') is None or matches_digest(path, entry)
+
+    def fetch_file(self, entry, sources, progress):
+        path = os.path.join(self.root, entry['path'])
+        part_path = path + '.part'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        errors = []
+        for source in sources:
+            try:
+                source.fetch(entry['path'], part_path, progress)
+            except Exception as e:
+                errors.append(f"{type(source).__name__}: {e}")
+                continue
+            if entry.get('sha256') is not None and not matches_digest(part_path, entry):
+                # fichier corrompu : on repart de zéro avec la source suivante
+                os.remove(part_path)
+                errors.append(f"{type(source).__name__}: somme de contrôle invalide")
+                continue
+            os.replace(part_path, path)
+            return
+        raise IOError(f"{entry['path']} : " + ' ; '.join(errors or ['aucune source']))
+
+    def provision(self, name):
+        dataset = self.manifest['datasets'][name]
+        sources = [self.mirror] if self.mirror else []
+        sources += [make_source(spec) for spec in dataset.get('sources', [])]
+        try:
+            self._update(name, state=VERIFYING)
+            files = self.files(name)
+            missing = [entry for entry in files if not self.verify(entry)]
+            total = sum(entry.get('size') or 0 for entry in missing) or None
+            self._update(name, state=DOWNLOADING if missing else READY, done=0, total=total)
+            offset = 0
+            for entry in missing:
+                self.fetch_file(entry, sources,
+                                lambda done, size, offset=offset: self._update(name, done=offset + done,
+                                                                               total=total or size))
+                offset += entry.get('size') or 0
+            for entry in files:
+                if entry.get('sha256') is None:
+                    self.pin(entry)
+            self._update(name, state=READY, error=None)
+        except Exception as e:
+            self._update(name, state=ERROR, error=str(e))
+
+    def _launch(self, name):
+        thread = threading.Thread(target=self.provision, args=(name,), daemon=True, name=f"provision-{name}")
+        self._threads[name] = thread
+        thread.start()
+
+    def start(self, names=None):
+        # prélecture en arrière-plan, un fil par jeu de données
+        with self._lock:
+            for name in names or self.manifest['datasets']:
+                if name not in self._threads:
+                    self._launch(name)
+        return self
+
+    def retry(self, name):
+        with self._lock:
+            if self.status[name]['state'] == ERROR and not self._threads[name].is_alive():
+                self.status[name].update(state=MISSING, error=None)
+                self._launch(name)
+
+    def wait(self, name, timeout=None):
+        # attendre la fin de la vérification (ou du téléchargement) d'un jeu de données
+        thread = self._threads.get(name)
+        if thread is not None:
+            thread.join(timeout)
+        return self.is_ready(name)
+
+    def is_ready(self, name):
+        return self.status[name]['state'] == READY
+
+    def require(self, name):
+        if not self.is_ready(name):
+            raise DataNotReady(name)
+        return self.path(name)
+
+
+_provisioner = None
+_provisioner_lock = threading.Lock()
+
+
+def get_provisioner():
+    # un seul provisionneur par processus, partagé par toutes les sessions
+    global _provisioner
+    with _provisioner_lock:
+        if _provisioner is None:
+            _provisioner = Provisioner(load_manifest())
+    return _provisioner
+
+
+def start_prefetch():
+    return get_provisioner().start()
+
+
+def pin(names=None, path=manifest_path):
+    # enregistre taille et sha256 des fichiers présents localement dans le manifeste
+    # (jeux décrits par le registre des modèles : épinglés par model_registry.py et les pipelines)
+    manifest = load_manifest(path)
+    for name, dataset in manifest['datasets'].items():
+        if names and name not in names:
+            continue
+        for entry in dataset.get('files', []):
+            local = os.path.join(os.path.dirname(path), entry['path'])
+            if os.path.exists(local):
+                entry['size'] = os.path.getsize(local)
+                entry['sha256'] = file_digest(local)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+        f.write('\n')
+
+
+if __name__ == "__main__":
+    # python data_provisioning.py [pin|fetch] [jeu de données ...]
+    command, names = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('fetch', [])
+    if command == 'pin':
+        pin(names)
+    else:
+        provisioner = Provisioner(load_manifest())
+        for name in names or provisioner.manifest['datasets']:
+            provisioner.provision(name)
+            print(name, provisioner.status[name])
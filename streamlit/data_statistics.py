@@ -0,0 +1,50 @@
+# data_statistics.py
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def group_stats(df, y, by):
+    # statistiques suffisantes par groupe : effectif, somme et somme des carrés des écarts à la moyenne du groupe
+    grouped = df.groupby(by, observed=True)[y].agg(['count', 'sum', 'var'])
+    grouped = grouped.loc[grouped['count'] > 0]
+    grouped['ss'] = grouped['var'].fillna(0) * (grouped['count'] - 1)
+    return grouped[['count', 'sum', 'ss']]
+
+
+def anova_oneway(group, term, numeric=False):
+    # table ANOVA (type I) identique à statsmodels.api.stats.anova_lm(smf.ols(f'y ~ {term}'))
+    n = group['count'].to_numpy(dtype=float)
+    means = group['sum'].to_numpy(dtype=float) / n
+    grand_mean = (n * means).sum() / n.sum()
+
+    ss_within = group['ss'].to_numpy(dtype=float).sum()
+    ss_between = (n * (means - grand_mean) ** 2).sum()
+
+    if numeric:
+        # régression linéaire simple sur la valeur du groupe (ex. MONTH entier)
+        x = group.index.to_numpy(dtype=float)
+        x_mean = (n * x).sum() / n.sum()
+        sxx = (n * (x - x_mean) ** 2).sum()
+        sxy = (n * (x - x_mean) * (means - grand_mean)).sum()
+        ss_term = sxy ** 2 / sxx
+        df_term = 1.0
+    else:
+        ss_term = ss_between
+        df_term = float(len(n) - 1)
+
+    ss_resid = ss_within + ss_between - ss_term
+    df_resid = n.sum() - df_term - 1
+    f_value = (ss_term / df_term) / (ss_resid / df_resid)
+
+    return pd.DataFrame({'df': [df_term, df_resid],
+                         'sum_sq': [ss_term, ss_resid],
+                         'mean_sq': [ss_term / df_term, ss_resid / df_resid],
+                         'F': [f_value, np.nan],
+                         'PR(>F)': [stats.f.sf(f_value, df_term, df_resid), np.nan]},
+                        index=[term, 'Residual'])
+
+
+def eta_squared(table):
+    # taille d'effet : part de la variance totale expliquée par le facteur
+    return table['sum_sq'].iloc[0] / table['sum_sq'].sum()
@@ -1,6 +1,46 @@
 # data_visualization.py
+import json
+import os
 import streamlit as st
+from data_provisioning import start_prefetch, ERROR
+from disk_cache import DiskCache
+
+# Figures plotly déjà construites, sérialisées en JSON (200 Mo au plus)
+figure_cache = DiskCache(os.path.join('data', 'cache', 'figures'), max_bytes=200 * 2**20, suffix='.json')
 
 
 def visualize_data(data):
     st.write(data)
+
+
+def cached_figure(name, version, params, build):
+    # figure reconstruite seulement si la version des données ou les paramètres changent
+    import plotly.io as pio
+    key = json.dumps([name, version, params], sort_keys=True, default=str)
+    data = figure_cache.get(key)
+    if data is None:
+        fig = build()
+        figure_cache.put(key, fig.to_json().encode())
+        return fig
+    return pio.from_json(data.decode())
+
+
+def show_data_status(name, timeout=2):
+    # état d'un jeu de données provisionné en arrière-plan : True si les données sont prêtes
+    provisioner = start_prefetch()
+    if provisioner.wait(name, timeout):
+        return True
+
+    status = provisioner.status[name]
+    if status['state'] == ERROR:
+        st.error(f"Les données « {name} » n'ont pas pu être récupérées : {status['error']}")
+        if st.button("Réessayer", key=f"retry_{name}"):
+            provisioner.retry(name)
+        return False
+
+    st.info(f"Les données « {name} » sont en cours de préparation, cette page sera disponible dans quelques instants.")
+    if status['total']:
+        st.progress(min(status['done'] / status['total'], 1.0),
+                    text=f"{status['done'] / 1e6:,.0f} / {status['total'] / 1e6:,.0f} Mo")
+    st.button("Actualiser", key=f"refresh_{name}")
+    return False
@@ -0,0 +1,78 @@
+# disk_cache.py
+import hashlib
+import os
+import threading
+
+# l'éviction libère jusqu'à cette fraction de la limite, pour ne pas reparcourir le dossier à chaque écriture
+EVICT_TO = 0.9
+
+
+class DiskCache:
+    # cache disque clé -> octets, borné en taille (éviction des entrées les moins récemment utilisées)
+    def __init__(self, directory, max_bytes, suffix=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        # taille totale des entrées, mesurée par un seul parcours du dossier puis tenue à jour à chaque écriture
+        self._total = None
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + self.suffix)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # la date de modification sert de date de dernier accès pour l'éviction
+        os.utime(path)
+        return data
+
+    def put(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._total is not None:
+                self._total += len(data) - replaced
+                # dossier reparcouru seulement quand la limite semble dépassée
+                # (le total suivi ignore les écritures des autres processus)
+                if self._total <= self.max_bytes:
+                    return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(self.suffix) and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                self._total = total
+                return
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._total = total
+
+    def size(self):
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
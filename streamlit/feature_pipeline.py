@@ -0,0 +1,413 @@
+# feature_pipeline.py
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from data_provisioning import data_dir
+from model_registry import registry_path, update_entries
+
+# Tables par forêt et par jour produites en amont (mêmes fichiers que US_Forest_Service/selected_forests.ipynb)
+inputs_dir = os.path.join(data_dir, 'forest_inputs')
+WEATHER_PATH = os.path.join(inputs_dir, 'weather_data_forest.csv.gz')
+LIGHTNINGS_PATH = os.path.join(inputs_dir, 'light_data_forest.csv.gz')
+WILDFIRES_PATH = os.path.join(inputs_dir, 'wildfires_data_forest.csv.gz')
+
+modeling_dir = os.path.join(data_dir, 'modeling_data')
+forests_path = os.path.join(data_dir, 'forests_with_stations.csv')
+# résumés annuels de toutes les forêts (page des forêts nationales), tenus à jour avec les tables
+summary_path = os.path.join(modeling_dir, 'yearly_summary.csv')
+# état des fenêtres glissantes au dernier jour écrit, pour l'ajout jour par jour
+state_path = os.path.join(data_dir, 'cache', 'feature_state.npz')
+
+START, END = '1992-01-01', '2015-12-31'
+
+# Fenêtres glissantes (jour courant exclu) : moyennes météo sur les jours calendaires précédents,
+# nombres de feux sur les lignes précédentes de la table, jours sans météo déjà écartés
+# (comme les fichiers actuels)
+WEATHER_WINDOWS = {'TMAX_mean': [10, 30], 'PRCP_mean': [10, 30]}
+WILDFIRE_WINDOWS = [1, 10, 30]
+
+FEATURE_COLUMNS = ['year', 'day_of_year', 'TMAX_mean', 'TMAX_mean_10D', 'TMAX_mean_30D',
+                   'PRCP_mean', 'PRCP_mean_10D', 'PRCP_mean_30D', 'lightnings',
+                   '#wildfires_1D', '#wildfires_10D', '#wildfires_30D', 'target']
+WEATHER_COLUMNS = [f"{column}{suffix}" for column, windows in WEATHER_WINDOWS.items()
+                   for suffix in [''] + [f"_{window}D" for window in windows]]
+# agrégats annuels affichés par forêt : jours de feu, temp. max moyenne, cumul de pluie, jours de foudre
+SUMMARY_AGG = {'target': 'sum', 'TMAX_mean': 'mean', 'PRCP_mean': 'sum', 'lightnings': 'sum'}
+# valeurs conservées par forêt (jours pour la météo, lignes pour les feux) :
+# de quoi calculer la plus longue fenêtre
+STATE_DAYS = max(max(windows) for windows in [*WEATHER_WINDOWS.values(), WILDFIRE_WINDOWS])
+
+
+def load_inputs(weather_path=WEATHER_PATH, lightnings_path=LIGHTNINGS_PATH, wildfires_path=WILDFIRES_PATH):
+    weather = pd.read_csv(weather_path, index_col=0, parse_dates=['date'], float_precision='round_trip',
+                          usecols=lambda column: column in ['Unnamed: 0', 'PROCLAIMED', 'date', *WEATHER_COLUMNS])
+    lightnings = pd.read_csv(lightnings_path, usecols=['PROCLAIMED', '#ZDAY'], parse_dates=['#ZDAY'])
+    wildfires = pd.read_csv(wildfires_path, usecols=['PROCLAIMED', 'DISCO_DATE'], parse_dates=['DISCO_DATE'])
+    return weather, lightnings.rename(columns={'#ZDAY': 'date'}), wildfires.rename(columns={'DISCO_DATE': 'date'})
+
+
+def weather_windows(weather):
+    # moyennes glissantes manquantes dans la table météo : fenêtres en jours calendaires, par forêt
+    weather = weather.sort_values(['PROCLAIMED', 'date'])
+    for column, windows in WEATHER_WINDOWS.items():
+        for window in windows:
+            name = f"{column}_{window}D"
+            if name not in weather:
+                rolled = (weather.groupby('PROCLAIMED').rolling(f"{window}D", on='date', closed='left')[column]
+                          .mean())
+                weather[name] = rolled.to_numpy()
+    return weather
+
+
+def build_panel(weather, lightnings, wildfires, start=START, end=END):
+    # une ligne par (forêt, jour du calendrier), comme dans le notebook ;
+    # jointures sur les deux clés pour toutes les forêts à la fois
+    forests = np.sort(weather['PROCLAIMED'].unique())
+    dates = pd.date_range(start, end)
+    panel = pd.DataFrame(index=pd.MultiIndex.from_product([forests, dates], names=['PROCLAIMED', 'date']))
+    panel = panel.join(weather_windows(weather).set_index(['PROCLAIMED', 'date'])[WEATHER_COLUMNS])
+
+    flashes = lightnings.drop_duplicates(['PROCLAIMED', 'date']).set_index(['PROCLAIMED', 'date'])
+    panel['lightnings'] = panel.index.isin(flashes.index).astype('float64')
+    fires = wildfires.groupby(['PROCLAIMED', 'date']).size().rename('#wildfires')
+    panel = panel.join(fires)
+    panel['#wildfires'] = panel['#wildfires'].fillna(0).astype('float64')
+
+    # feux des lignes précédentes, toutes les forêts en un seul passage groupé ; les jours sans météo
+    # ne comptent pas (leurs feux non plus) : fenêtres NaN sur ces jours, écartés par feature_tables
+    kept = panel[WEATHER_COLUMNS].notna().all(axis=1).to_numpy()
+    by_forest = panel.loc[kept, '#wildfires'].groupby(level='PROCLAIMED', sort=False)
+    for window in WILDFIRE_WINDOWS:
+        panel[f"#wildfires_{window}D"] = np.nan
+        panel.loc[kept, f"#wildfires_{window}D"] = by_forest.rolling(window, closed='left').sum().fillna(0).to_numpy()
+
+    panel['target'] = (panel['#wildfires'] > 0).astype('int64')
+    dates = panel.index.get_level_values('date')
+    panel['year'] = dates.year.astype('int64')
+    panel['day_of_year'] = dates.dayofyear.astype('int64')
+    return panel
+
+
+def feature_tables(panel):
+    # jours sans météo écartés (fenêtres de feux déjà calculées sur les lignes restantes) ;
+    # colonnes dans l'ordre des fichiers *_preprocessed.csv, une table par forêt
+    panel = panel.dropna(subset=WEATHER_COLUMNS)
+    return {proclaimed: table.reset_index(drop=True)
+            for proclaimed, table in panel[FEATURE_COLUMNS].groupby(level='PROCLAIMED', sort=False)}
+
+
+def forest_names(path=forests_path):
+    stations = pd.read_csv(path, index_col=0)
+    return dict(zip(stations['PROCLAIMED'], stations['FORESTNAME']))
+
+
+def write_table(table, path):
+    tmp_path = path + '.tmp'
+    table.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_tables(tables, directory=modeling_dir, workers=None):
+    # écriture des CSV en parallèle, une forêt par tâche
+    names = forest_names()
+    paths = [os.path.join(directory, f"{names[proclaimed]}_preprocessed.csv") for proclaimed in tables]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(write_table, tables.values(), paths))
+
+
+def compare_tables(tables, directory=modeling_dir):
+    # écart entre les tables reconstruites et les fichiers actuels : (lignes en plus ou en moins, écart max)
+    names = forest_names()
+    differences = {}
+    for proclaimed, table in tables.items():
+        path = os.path.join(directory, f"{names[proclaimed]}_preprocessed.csv")
+        if not os.path.exists(path):
+            differences[names[proclaimed]] = (len(table), np.nan)
+            continue
+        current = pd.read_csv(path, float_precision='round_trip')
+        if current.shape != table.shape or list(current.columns) != list(table.columns):
+            differences[names[proclaimed]] = (len(table) - len(current), np.nan)
+            continue
+        gap = np.abs(current.to_numpy(dtype='float64') - table.to_numpy(dtype='float64')).max()
+        if gap > 0:
+            differences[names[proclaimed]] = (0, gap)
+    return differences
+
+
+def yearly_summary(tables):
+    # une ligne par forêt (nom) et par année ; nombre de jours gardé pour fusionner les moyennes
+    rows = pd.concat(tables, names=['forest', None]).reset_index('forest')
+    summary = rows.groupby(['forest', 'year'], as_index=False).agg(
+        days=('year', 'size'), **{column: (column, how) for column, how in SUMMARY_AGG.items()})
+    return summary.sort_values(['forest', 'year'], ignore_index=True)
+
+
+def merge_summary(summary, added):
+    # années complétées par l'ajout de jours : sommes additionnées, moyennes pondérées par les jours
+    means = [column for column, how in SUMMARY_AGG.items() if how == 'mean']
+    rows = pd.concat([summary, added], ignore_index=True)
+    rows[means] = rows[means].mul(rows['days'], axis=0)
+    merged = rows.groupby(['forest', 'year'], as_index=False)[['days', *SUMMARY_AGG]].sum()
+    merged[means] = merged[means].div(merged['days'], axis=0)
+    return merged.sort_values(['forest', 'year'], ignore_index=True)
+
+
+def load_summary(path=summary_path, directory=modeling_dir):
+    # résumé reconstruit depuis les fichiers *_preprocessed.csv s'il n'existe pas encore
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    tables = {name: pd.read_csv(os.path.join(directory, f"{name}_preprocessed.csv"), usecols=['year', *SUMMARY_AGG])
+              for name in sorted(forest_names().values())
+              if os.path.exists(os.path.join(directory, f"{name}_preprocessed.csv"))}
+    summary = yearly_summary(tables)
+    write_table(summary, path)
+    return summary
+
+
+def panel_state(panel):
+    # météo : derniers jours du calendrier de chaque forêt (jours sans météo compris, en NaN) ;
+    # feux : dernières lignes gardées de chaque forêt et nombre de lignes gardées
+    forests = panel.index.get_level_values('PROCLAIMED').unique()
+    dates = panel.index.get_level_values('date').unique()
+    state = {'forests': np.asarray(forests), 'date': np.datetime64(dates[-1], 'D')}
+    for column in WEATHER_WINDOWS:
+        values = panel[column].to_numpy(dtype='float64').reshape(len(forests), len(dates))
+        window = np.full((len(forests), STATE_DAYS), np.nan)
+        last = values[:, -STATE_DAYS:]
+        window[:, STATE_DAYS - last.shape[1]:] = last
+        state[column] = window
+    fires = panel.loc[panel[WEATHER_COLUMNS].notna().all(axis=1), '#wildfires']
+    by_forest = fires.groupby(level='PROCLAIMED')
+    # rang de chaque ligne depuis la fin de sa forêt : les STATE_DAYS dernières remplissent la fenêtre
+    position = by_forest.cumcount(ascending=False).to_numpy()
+    last = position < STATE_DAYS
+    forest = forests.get_indexer(fires.index.get_level_values('PROCLAIMED'))
+    state['#wildfires'] = np.zeros((len(forests), STATE_DAYS))
+    state['#wildfires'][forest[last], STATE_DAYS - 1 - position[last]] = fires.to_numpy(dtype='float64')[last]
+    state['rows'] = by_forest.size().reindex(forests, fill_value=0).to_numpy(dtype='int64')
+    return state
+
+
+def save_state(state, path=state_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **state)
+    os.replace(tmp_path, path)
+
+
+def load_state(path=state_path):
+    if not os.path.exists(path):
+        # premier ajout : état reconstruit une fois à partir des tables d'entrée
+        return panel_state(build_panel(*load_inputs()))
+    with np.load(path, allow_pickle=False) as saved:
+        state = {key: saved[key] for key in saved.files}
+    if 'rows' not in state:
+        raise ValueError(f"{path} : état enregistré avant le calcul des fenêtres de feux par ligne : "
+                         f"relancer `python feature_pipeline.py build`")
+    state['date'] = state['date'].astype('datetime64[D]')[()]
+    return state
+
+
+def next_day(state, weather, flashes, fires):
+    # ligne du jour suivant l'état pour chaque forêt, puis avancée de l'état : O(forêts)
+    # weather, fires : valeurs du jour indexées par forêt ; flashes : forêts touchées par la foudre
+    day = pd.Timestamp(state['date'] + np.timedelta64(1, 'D'))
+    forests = state['forests']
+    today = {column: weather[column].reindex(forests).to_numpy(dtype='float64') for column in WEATHER_WINDOWS}
+    today['#wildfires'] = fires.reindex(forests, fill_value=0).to_numpy(dtype='float64')
+
+    row = pd.DataFrame(index=pd.Index(forests, name='PROCLAIMED'))
+    row['year'] = day.year
+    row['day_of_year'] = day.dayofyear
+    with warnings.catch_warnings():
+        # moyenne d'une fenêtre sans aucune mesure : NaN, comme le rolling de la reconstruction complète
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for column, windows in WEATHER_WINDOWS.items():
+            row[column] = today[column]
+            for window in windows:
+                name = f"{column}_{window}D"
+                # comme weather_windows : moyenne fournie par la table météo, sinon calculée sur l'état
+                if name in weather:
+                    row[name] = weather[name].reindex(forests).to_numpy(dtype='float64')
+                else:
+                    row[name] = np.nanmean(state[column][:, -window:], axis=1)
+    row['lightnings'] = np.isin(forests, flashes).astype('float64')
+    for window in WILDFIRE_WINDOWS:
+        # moins de `window` lignes gardées avant ce jour : 0, comme fillna(0) après le rolling
+        sums = state['#wildfires'][:, -window:].sum(axis=1)
+        row[f"#wildfires_{window}D"] = np.where(state['rows'] >= window, sums, 0.0)
+    row['target'] = (today['#wildfires'] > 0).astype('int64')
+
+    for column in WEATHER_WINDOWS:
+        state[column][:, :-1] = state[column][:, 1:]
+        state[column][:, -1] = today[column]
+    # fenêtre des feux avancée seulement pour les forêts dont la ligne du jour est gardée
+    kept = row[WEATHER_COLUMNS].notna().all(axis=1).to_numpy()
+    state['#wildfires'][kept, :-1] = state['#wildfires'][kept, 1:]
+    state['#wildfires'][kept, -1] = today['#wildfires'][kept]
+    state['rows'] += kept
+    state['date'] = state['date'] + np.timedelta64(1, 'D')
+    return row[kept][FEATURE_COLUMNS]
+
+
+def append_days(state, weather, lightnings, wildfires):
+    # lignes des jours postérieurs à l'état présents dans les tables d'entrée, jour après jour
+    end = max((frame['date'].max() for frame in (weather, lightnings, wildfires) if len(frame)),
+              default=pd.Timestamp(state['date']))
+    weather = weather.set_index(['date', 'PROCLAIMED'])
+    flashes = lightnings.groupby('date')['PROCLAIMED'].unique()
+    fires = wildfires.groupby(['date', 'PROCLAIMED']).size()
+    empty = pd.DataFrame(columns=list(WEATHER_WINDOWS), dtype='float64')
+    rows = {}
+    while pd.Timestamp(state['date']) < end:
+        day = pd.Timestamp(state['date'] + np.timedelta64(1, 'D'))
+        weather_day = weather.loc[day] if day in weather.index.levels[0] else empty
+        fires_day = fires.loc[day] if day in fires.index.levels[0] else pd.Series(dtype='float64')
+        rows[day] = next_day(state, weather_day, flashes.get(day, []), fires_day)
+    if not rows:
+        return pd.DataFrame(columns=FEATURE_COLUMNS, index=pd.MultiIndex.from_tuples([], names=['PROCLAIMED', 'date']))
+    return pd.concat(rows, names=['date']).swaplevel().sort_index()
+
+
+def last_day(path):
+    # date de la dernière ligne d'un fichier, lue depuis la fin
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path) - 4096))
+        year, day_of_year = f.read().decode().rstrip().rsplit('\n', 1)[-1].split(',')[:2]
+    return pd.Timestamp(f"{year}-01-01") + pd.Timedelta(days=int(day_of_year) - 1)
+
+
+def append_tables(tables, offsets, directory=modeling_dir):
+    # nouvelles lignes ajoutées en fin de fichier, sans relire les lignes existantes ;
+    # taille de chaque fichier avant écriture notée dans offsets (chemin -> octets) pour revenir en arrière
+    for name, table in tables.items():
+        path = os.path.join(directory, f"{name}_preprocessed.csv")
+        offsets[path] = os.path.getsize(path)
+        table.to_csv(path, mode='a', header=False, index=False)
+
+
+def append(paths, directory=modeling_dir, state_path=state_path, summary_path=summary_path,
+           registry_path=registry_path):
+    # python feature_pipeline.py append météo.csv.gz foudre.csv.gz feux.csv.gz (mêmes formats que les entrées)
+    state = load_state(state_path)
+    first_day = pd.Timestamp(state['date'] + np.timedelta64(1, 'D'))
+    weather, lightnings, wildfires = (frame[frame['date'] >= first_day] for frame in load_inputs(*paths))
+    names = forest_names()
+    ahead = [names[proclaimed] for proclaimed in state['forests']
+             if last_day(os.path.join(directory, f"{names[proclaimed]}_preprocessed.csv")) >= first_day]
+    if ahead:
+        raise ValueError(f"État des fenêtres antérieur aux fichiers ({', '.join(ahead[:3])}…) : "
+                         f"relancer `python feature_pipeline.py build`")
+    # lignes et résumés calculés en entier avant d'écrire le moindre fichier
+    rows = append_days(state, weather, lightnings, wildfires)
+    tables = {names[proclaimed]: table.droplevel('PROCLAIMED')
+              for proclaimed, table in rows.groupby(level='PROCLAIMED', sort=False)}
+    summary = merge_summary(load_summary(summary_path, directory), yearly_summary(tables)) if tables else None
+
+    # tables complétées sur place, résumé et état écrits à côté des originaux puis mis en place :
+    # une erreur en cours de route tronque les tables à leur taille d'origine, résumé, état et registre inchangés
+    offsets, staged = {}, {}
+    try:
+        append_tables(tables, offsets, directory)
+        if tables:
+            staged[summary_path] = summary_path + '.tmp'
+            summary.to_csv(staged[summary_path], index=False)
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        staged[state_path] = state_path + '.tmp.npz'
+        np.savez(staged[state_path], **state)
+    except BaseException:
+        for path, size in offsets.items():
+            os.truncate(path, size)
+        for tmp_path in staged.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    # état en dernier : un arrêt avant lui laisse des fichiers en avance, refusés au prochain ajout
+    state_tmp_path = staged.pop(state_path)
+    for path, tmp_path in staged.items():
+        os.replace(tmp_path, path)
+    appended = {name: len(table) for name, table in tables.items()}
+    if appended:
+        update_entries(appended, path=registry_path, root=os.path.dirname(registry_path))
+    os.replace(state_tmp_path, state_path)
+    return appended
+
+
+def verify(days=60):
+    # ajout jour par jour des derniers jours de l'historique contre la reconstruction complète,
+    # avec les moyennes météo de la table d'entrée puis recalculées (état et weather_windows)
+    inputs = load_inputs()
+    cutoff = pd.Timestamp(END) - pd.Timedelta(days=days)
+    computed = [name for name in WEATHER_COLUMNS if name not in WEATHER_WINDOWS]
+    ok = True
+    for label, (weather, lightnings, wildfires) in [
+            ('moyennes météo fournies', inputs),
+            ('moyennes météo recalculées', (inputs[0].drop(columns=computed, errors='ignore'), *inputs[1:]))]:
+        state = panel_state(build_panel(weather, lightnings, wildfires, end=cutoff))
+        start = time.perf_counter()
+        rows = append_days(state, *(frame[frame['date'] > cutoff] for frame in (weather, lightnings, wildfires)))
+        elapsed = time.perf_counter() - start
+        expected = build_panel(weather, lightnings, wildfires).dropna(subset=WEATHER_COLUMNS)[FEATURE_COLUMNS]
+        expected = expected[expected.index.get_level_values('date') > cutoff]
+        missing = len(expected.index.symmetric_difference(rows.index))
+        rows = rows.reindex(expected.index)
+        gap = np.nanmax(np.abs(rows.to_numpy(dtype='float64') - expected.to_numpy(dtype='float64')))
+        same = missing == 0 and gap < 1e-9
+        ok = ok and same
+        print(f"{label} : {len(expected)} lignes ajoutées sur {days} jours en {elapsed:.2f} s, "
+              f"écart max {gap:.3g} : {'identique à' if same else 'DIFFÉRENT de'} la reconstruction complète")
+    return ok
+
+
+def build():
+    start = time.perf_counter()
+    panel = build_panel(*load_inputs())
+    tables = feature_tables(panel)
+    print(f"{len(tables)} forêts calculées en {time.perf_counter() - start:.1f} s")
+    return panel, tables
+
+
+if __name__ == "__main__":
+    # python feature_pipeline.py [build|check] [nb de processus]
+    # python feature_pipeline.py append météo.csv.gz foudre.csv.gz feux.csv.gz
+    # python feature_pipeline.py verify [nb de jours]
+    # python feature_pipeline.py summary   résumés annuels recalculés depuis les fichiers actuels
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    if command == 'append':
+        start = time.perf_counter()
+        appended = append(sys.argv[2:5])
+        print(f"{sum(appended.values())} lignes ajoutées à {len(appended)} forêts en {time.perf_counter() - start:.1f} s")
+        sys.exit(0)
+    if command == 'summary':
+        start = time.perf_counter()
+        if os.path.exists(summary_path):
+            os.remove(summary_path)
+        summary = load_summary()
+        print(f"{summary_path} : {summary['forest'].nunique()} forêts, {len(summary)} lignes "
+              f"en {time.perf_counter() - start:.1f} s")
+        sys.exit(0)
+    if command == 'verify':
+        sys.exit(0 if verify(int(sys.argv[2]) if len(sys.argv) > 2 else 60) else 1)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    panel, tables = build()
+    if command == 'check':
+        differences = compare_tables(tables)
+        for name, (rows, gap) in differences.items():
+            print(f"{name} : {rows:+d} lignes, écart max {gap:.3g}")
+        print(f"{len(tables) - len(differences)} forêts identiques aux fichiers actuels, {len(differences)} différentes")
+        sys.exit(1 if differences else 0)
+    start = time.perf_counter()
+    write_tables(tables, workers=workers)
+    names = forest_names()
+    tables = {names[proclaimed]: table for proclaimed, table in tables.items()}
+    write_table(yearly_summary(tables), summary_path)
+    # tailles, empreintes et nombres de lignes des fichiers réécrits : jeu `modeling` toujours valide
+    update_entries({name: len(table) for name, table in tables.items()}, replace=True)
+    save_state(panel_state(panel))
+    print(f"{len(tables)} fichiers écrits et registre mis à jour en {time.perf_counter() - start:.1f} s ; "
+          f"`python model_evaluation.py stale` pour réévaluer les forêts dont la table a changé")
@@ -0,0 +1,213 @@
+# forest_geodata.py
+import json
+import os
+import sys
+import threading
+import time
+import pandas as pd
+from data_provisioning import data_dir, file_digest
+
+stations_path = os.path.join(data_dir, 'ghcnd-stations_cleaned.tsv')
+forests_shape_path = os.path.join(data_dir, 'forests_shape', 'S_USA.ProclaimedForest.shp')
+# Aire de chaque forêt étendue de 5 km pour l'identification des stations météo
+forests_ext_path = os.path.join(data_dir, 'forests_extended_shape_5km', 'us_forests_ext_d5.shp')
+# Rattachement station -> forêt(s), reconstruit quand l'un des fichiers d'entrée change
+station_index_path = os.path.join(data_dir, 'cache', 'station_index.json')
+# Contours simplifiés à plusieurs tolérances, reconstruits quand les shapefiles changent
+geometry_dir = os.path.join(data_dir, 'cache', 'geometry')
+GEOMETRY_SOURCES = {'forests': forests_shape_path, 'forests_ext': forests_ext_path}
+
+STATION_COLUMNS = ['id_station', 'lat', 'long']
+SHAPE_PARTS = ['.shp', '.shx', '.dbf', '.prj']
+
+# Niveaux de détail : tolérances de simplification en degrés (0 : contours d'origine)
+TOLERANCES = [0.0, 0.0005, 0.002, 0.01, 0.05]
+# Largeur de carte supposée (pixels) et taille des tuiles pour traduire une emprise ou un zoom en degrés par pixel
+MAP_WIDTH_PX = 1000
+TILE_SIZE = 256
+# Emprise (ouest, sud, est, nord) des cartes nationales
+US_EXTENT = (-125.0, 24.0, -66.0, 50.0)
+
+
+def shape_digests(path):
+    # empreintes de toutes les composantes d'un shapefile
+    base = os.path.splitext(path)[0]
+    return {os.path.relpath(base + part, data_dir): file_digest(base + part)
+            for part in SHAPE_PARTS if os.path.exists(base + part)}
+
+
+def input_digests(stations_path=stations_path, forests_path=forests_ext_path):
+    # empreintes des fichiers d'entrée : clé de l'index
+    return {os.path.relpath(stations_path, data_dir): file_digest(stations_path), **shape_digests(forests_path)}
+
+
+def build_station_index(stations_path=stations_path, forests_path=forests_ext_path):
+    # jointure spatiale faite une fois pour toutes : stations contenues dans chaque forêt étendue
+    import geopandas as gpd
+    df = pd.read_csv(stations_path, sep='\t', header=None, names=['id_station', 'lat', 'long', 'unk', 'state'],
+                     usecols=STATION_COLUMNS)
+    stations = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.long, df.lat), crs="EPSG:4269")
+    forests = gpd.read_file(forests_path, columns=['PROCLAIMED']).to_crs("EPSG:4269")
+    joined = gpd.sjoin(stations, forests[['PROCLAIMED', 'geometry']], how='inner')
+    joined['PROCLAIMED'] = joined['PROCLAIMED'].astype(str)
+    return {
+        'version': 1,
+        'inputs': input_digests(stations_path, forests_path),
+        'stations': joined.groupby('id_station')['PROCLAIMED'].agg(sorted).to_dict(),
+        'forests': {proclaimed: group[STATION_COLUMNS].values.tolist()
+                    for proclaimed, group in joined.sort_values('id_station').groupby('PROCLAIMED')},
+    }
+
+
+def write_station_index(index, path=station_index_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+class StationIndex:
+    def __init__(self, index):
+        self.inputs = index['inputs']
+        self.stations = index['stations']
+        self.forests = index['forests']
+
+    def forests_of(self, station_id):
+        # identifiants PROCLAIMED des forêts (étendues) contenant la station
+        return self.stations.get(station_id, [])
+
+    def stations_of(self, proclaimed):
+        # stations d'une forêt : identifiant, latitude, longitude
+        return pd.DataFrame(self.forests.get(str(proclaimed), []), columns=STATION_COLUMNS)
+
+
+def load_station_index(path=station_index_path, stations_path=stations_path, forests_path=forests_ext_path):
+    # index lu sur le disque s'il correspond aux fichiers d'entrée actuels, reconstruit sinon
+    inputs = input_digests(stations_path, forests_path)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == 1 and index.get('inputs') == inputs:
+            return StationIndex(index)
+    index = build_station_index(stations_path, forests_path)
+    write_station_index(index, path)
+    return StationIndex(index)
+
+
+_station_index = None
+_station_index_lock = threading.Lock()
+
+
+def get_station_index():
+    # un seul index par processus ; clé revérifiée (empreintes en cache tant que les fichiers sont inchangés)
+    global _station_index
+    with _station_index_lock:
+        if _station_index is None or _station_index.inputs != input_digests():
+            _station_index = load_station_index()
+    return _station_index
+
+
+def level_for(extent=None, zoom=None, width_px=MAP_WIDTH_PX):
+    # plus grande tolérance sous la taille d'un pixel (degrés) : simplification invisible à l'écran
+    if zoom is not None:
+        pixel = 360 / (TILE_SIZE * 2 ** zoom)
+    elif extent is not None:
+        w, s, e, n = extent
+        pixel = max(e - w, n - s) / width_px
+    else:
+        return TOLERANCES[0]
+    return max(tolerance for tolerance in TOLERANCES if tolerance <= pixel)
+
+
+def geometry_path(name, tolerance, directory=geometry_dir):
+    return os.path.join(directory, f"{name}.{tolerance:g}.parquet")
+
+
+def build_geometry_store(sources=GEOMETRY_SOURCES, directory=geometry_dir):
+    # chaque source lue une fois, écrite en GeoParquet à chaque niveau de détail ;
+    # simplification avec preserve_topology : polygones toujours valides, sans trou ni auto-intersection
+    import geopandas as gpd
+    os.makedirs(directory, exist_ok=True)
+    index = {'version': 1, 'tolerances': TOLERANCES, 'inputs': {}}
+    for name, path in sources.items():
+        gdf = gpd.read_file(path).to_crs("EPSG:4269")
+        for tolerance in TOLERANCES:
+            level = gdf if tolerance == 0 else gdf.assign(geometry=gdf.geometry.simplify(tolerance,
+                                                                                         preserve_topology=True))
+            tmp_path = geometry_path(name, tolerance, directory) + '.tmp'
+            level.to_parquet(tmp_path)
+            os.replace(tmp_path, geometry_path(name, tolerance, directory))
+        index['inputs'][name] = shape_digests(path)
+    write_station_index(index, os.path.join(directory, 'index.json'))
+    return index
+
+
+class GeometryStore:
+    def __init__(self, index, directory=geometry_dir):
+        self.inputs = index['inputs']
+        self.directory = directory
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def level(self, name, tolerance):
+        # un niveau lu une fois puis gardé en mémoire
+        with self._lock:
+            if (name, tolerance) not in self._levels:
+                import geopandas as gpd
+                self._levels[(name, tolerance)] = gpd.read_parquet(geometry_path(name, tolerance, self.directory))
+            return self._levels[(name, tolerance)]
+
+    def shapes(self, name, extent=None, zoom=None, width_px=MAP_WIDTH_PX):
+        # toutes les formes d'une source au niveau adapté à l'emprise (lon/lat) ou au zoom demandé
+        return self.level(name, level_for(extent, zoom, width_px))
+
+    def forest(self, name, forest, width_px=MAP_WIDTH_PX):
+        # formes d'une forêt au niveau adapté à sa propre emprise (mesurée sur le niveau le plus grossier)
+        coarse = self.level(name, TOLERANCES[-1])
+        if not (coarse['FORESTNAME'] == forest).any():
+            return coarse.iloc[:0]
+        extent = coarse.loc[coarse['FORESTNAME'] == forest].total_bounds
+        shapes = self.shapes(name, extent=extent, width_px=width_px)
+        return shapes.loc[shapes['FORESTNAME'] == forest]
+
+
+def load_geometry_store(sources=GEOMETRY_SOURCES, directory=geometry_dir):
+    # niveaux lus sur le disque s'ils correspondent aux shapefiles actuels, reconstruits sinon
+    inputs = {name: shape_digests(path) for name, path in sources.items()}
+    index_path = os.path.join(directory, 'index.json')
+    if os.path.exists(index_path):
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == 1 and index.get('tolerances') == TOLERANCES and index.get('inputs') == inputs:
+            return GeometryStore(index, directory)
+    return GeometryStore(build_geometry_store(sources, directory), directory)
+
+
+_geometry_store = None
+_geometry_store_lock = threading.Lock()
+
+
+def get_geometry_store():
+    # un seul jeu de contours par processus, partagé par les onglets et les sessions
+    global _geometry_store
+    with _geometry_store_lock:
+        if _geometry_store is None or _geometry_store.inputs != {name: shape_digests(path)
+                                                                  for name, path in GEOMETRY_SOURCES.items()}:
+            _geometry_store = load_geometry_store()
+    return _geometry_store
+
+
+if __name__ == "__main__":
+    # python forest_geodata.py [build]   index des stations et contours simplifiés
+    start = time.perf_counter()
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        write_station_index(build_station_index())
+        build_geometry_store()
+    index = load_station_index()
+    print(f"{station_index_path} : {len(index.stations)} stations rattachées à {len(index.forests)} forêts "
+          f"({time.perf_counter() - start:.1f} s)")
+    store = load_geometry_store()
+    for name in GEOMETRY_SOURCES:
+        vertices = [int(store.level(name, tolerance).get_coordinates().shape[0]) for tolerance in TOLERANCES]
+        print(f"{name} : " + ', '.join(f"{tolerance:g}° -> {count} sommets" for tolerance, count in zip(TOLERANCES, vertices)))
@@ -0,0 +1,234 @@
+# lightning_pipeline.py
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from data_provisioning import data_dir
+from feature_pipeline import LIGHTNINGS_PATH
+from partitioned_dataset import ingest_years, write_year
+
+# Fichiers annuels NLDN de la SWDI (https://www.ncei.noaa.gov/pub/data/swdi/database-csv/v2/)
+tiles_dir = os.path.join(data_dir, 'nldn')
+TILES_PATTERN = 'nldn-tiles-{}.csv.gz'
+# Jeu colonnaire typé, partitionné par année et par mois (year=AAAA/month=M/part-0.parquet)
+dataset_dir = os.path.join(data_dir, 'lightnings')
+# Impacts de toutes les années en un seul CSV (ancienne sortie de US_Forest_Service/lightnings.ipynb)
+LIGHTNINGS_SOURCE = os.path.join(data_dir, 'lightnings.csv.gz')
+# Forêts élargies de 100 km, comme dans US_Forest_Service/light_data_forests.ipynb
+forests_ext_path = os.path.join(data_dir, 'forests_extended_shape_100km', 'us_forests_ext_d100.shp')
+
+SOURCE_COLUMNS = ['#ZDAY', 'CENTERLON', 'CENTERLAT', 'TOTAL_COUNT']
+SCHEMA = pa.schema([('#ZDAY', pa.date32()), ('CENTERLON', pa.float64()), ('CENTERLAT', pa.float64()),
+                    ('TOTAL_COUNT', pa.int32())])
+POINT_COLUMNS = ['CENTERLON', 'CENTERLAT']
+KEYS = ['PROCLAIMED', '#ZDAY']
+
+# lignes lues par morceau ; morceaux en attente par processus
+CHUNK_ROWS = 1_000_000
+PENDING_PER_WORKER = 2
+# positions déjà rattachées gardées par processus (grille NLDN de 0,1°) ; au-delà le cache repart de zéro
+CACHE_POINTS = 2_000_000
+
+# état de chaque processus de calcul : forêts et index spatial, positions déjà rattachées
+_forests = None
+_seen = None
+_pairs = None
+
+
+def ingest_year(path, year, directory=dataset_dir):
+    # un fichier annuel lu par morceaux, écrit mois par mois
+    def chunks():
+        for chunk in pd.read_csv(path, header=2, usecols=SOURCE_COLUMNS, chunksize=CHUNK_ROWS):
+            chunk['#ZDAY'] = pd.to_datetime(chunk['#ZDAY'].astype(str), format='%Y%m%d')
+            yield chunk
+    return year, write_year(chunks(), year, directory, SCHEMA, '#ZDAY')
+
+
+def ingest(source_dir=tiles_dir, directory=dataset_dir, workers=None, force=False):
+    paths = {int(os.path.basename(path)[len('nldn-tiles-'):][:4]): path
+             for path in sorted(glob.glob(os.path.join(source_dir, TILES_PATTERN.format('*'))))}
+    return ingest_years(ingest_year, paths, directory, workers, force)
+
+
+def read_chunks(source, chunk_rows=CHUNK_ROWS, nrows=None, years=None):
+    # impacts par morceaux : jeu partitionné (seulement les années demandées) ou CSV unique
+    if os.path.isdir(source):
+        dataset = ds.dataset(source, format='parquet', partitioning='hive')
+        row_filter = ds.field('year').isin(years) if years else None
+        chunks = (batch.to_pandas(date_as_object=False)
+                  for batch in dataset.to_batches(columns=SOURCE_COLUMNS, filter=row_filter, batch_size=chunk_rows))
+    else:
+        chunks = pd.read_csv(source, usecols=SOURCE_COLUMNS, chunksize=chunk_rows)
+    remaining = nrows
+    for chunk in chunks:
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            chunk = chunk.iloc[:remaining]
+            remaining -= len(chunk)
+        if pd.api.types.is_integer_dtype(chunk['#ZDAY']):
+            chunk['#ZDAY'] = pd.to_datetime(chunk['#ZDAY'].astype(str), format='%Y%m%d')
+        chunk['#ZDAY'] = chunk['#ZDAY'].astype('datetime64[ns]')
+        # sommes en 64 bits quelle que soit la source
+        chunk['TOTAL_COUNT'] = chunk['TOTAL_COUNT'].astype('int64')
+        if years and not os.path.isdir(source):
+            chunk = chunk[chunk['#ZDAY'].dt.year.isin(years)]
+        yield chunk
+
+
+def default_source():
+    return dataset_dir if os.path.isdir(dataset_dir) else LIGHTNINGS_SOURCE
+
+
+def monthly_strikes(directory=dataset_dir):
+    # impacts et enregistrements par (année, mois), partition par partition : une colonne lue à la fois
+    dataset = ds.dataset(directory, format='parquet', partitioning='hive')
+    rows = []
+    for fragment in dataset.get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        counts = fragment.to_table(columns=['TOTAL_COUNT'])['TOTAL_COUNT']
+        rows.append({'year': keys['year'], 'month': keys['month'],
+                     'strikes': pc.sum(counts).as_py() or 0, 'records': len(counts)})
+    return pd.DataFrame(rows).groupby(['year', 'month'], as_index=False).sum()
+
+
+def load_forests(path=forests_ext_path):
+    # identifiants PROCLAIMED et index spatial (STRtree) des polygones, en coordonnées EPSG:4269
+    import geopandas as gpd
+    from shapely import STRtree
+    forests = gpd.read_file(path, columns=['PROCLAIMED'])
+    if forests.crs is not None and forests.crs != 'EPSG:4269':
+        forests = forests.to_crs('EPSG:4269')
+    return forests['PROCLAIMED'].astype(str).to_numpy(), STRtree(forests.geometry.to_numpy())
+
+
+def reset_cache():
+    global _seen, _pairs
+    _seen = pd.MultiIndex.from_arrays([[], []], names=POINT_COLUMNS)
+    _pairs = pd.DataFrame({'CENTERLON': pd.Series(dtype='float64'), 'CENTERLAT': pd.Series(dtype='float64'),
+                           'PROCLAIMED': pd.Series(dtype='object')})
+
+
+def init_worker(forests_path):
+    global _forests
+    _forests = load_forests(forests_path)
+    reset_cache()
+
+
+def locate(points):
+    # forêts contenant chaque position, même prédicat que gpd.sjoin (intersects) ;
+    # une position dans plusieurs forêts élargies compte pour chacune
+    import shapely
+    ids, tree = _forests
+    lon, lat = points['CENTERLON'].to_numpy(), points['CENTERLAT'].to_numpy()
+    point_index, forest_index = tree.query(shapely.points(lon, lat), predicate='intersects')
+    return pd.DataFrame({'CENTERLON': lon[point_index], 'CENTERLAT': lat[point_index],
+                         'PROCLAIMED': ids[forest_index]})
+
+
+def join_chunk(chunk):
+    # impacts du morceau cumulés par (forêt, jour) ; l'index spatial n'est interrogé
+    # que pour les positions jamais vues par ce processus
+    global _seen, _pairs
+    strikes = chunk.groupby([*POINT_COLUMNS, '#ZDAY'], sort=False)['TOTAL_COUNT'].sum().reset_index()
+    points = strikes[POINT_COLUMNS].drop_duplicates()
+    if len(_seen) + len(points) > CACHE_POINTS:
+        reset_cache()
+    new = points[~pd.MultiIndex.from_frame(points).isin(_seen)]
+    if len(new):
+        _seen = _seen.append(pd.MultiIndex.from_frame(new))
+        _pairs = pd.concat([_pairs, locate(new)], ignore_index=True)
+    joined = strikes.merge(_pairs, on=POINT_COLUMNS)
+    return joined.groupby(KEYS)['TOTAL_COUNT'].sum()
+
+
+def accumulate(totals, futures):
+    # cumul incrémental : la table reste de la taille du résultat (forêts x jours d'orage)
+    parts = [future.result() for future in futures]
+    if totals is not None:
+        parts.insert(0, totals)
+    return pd.concat(parts).groupby(level=KEYS).sum() if parts else totals
+
+
+def join_lightnings(source=None, forests_path=forests_ext_path, workers=None,
+                    chunk_rows=CHUNK_ROWS, nrows=None, years=None):
+    # lecture par morceaux et rattachement en parallèle : la mémoire dépend de la taille des morceaux
+    # et du nombre de processus, pas de la taille du fichier
+    workers = workers or os.cpu_count()
+    totals = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(forests_path,)) as pool:
+        pending = set()
+        for chunk in read_chunks(source or default_source(), chunk_rows, nrows, years):
+            if len(pending) >= PENDING_PER_WORKER * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                totals = accumulate(totals, done)
+            pending.add(pool.submit(join_chunk, chunk))
+        totals = accumulate(totals, pending)
+    return lightnings_table(totals)
+
+
+def lightnings_table(totals):
+    # même format que la sortie du notebook : PROCLAIMED, #ZDAY (date), TOTAL_COUNT
+    if totals is None:
+        return pd.DataFrame(columns=[*KEYS, 'TOTAL_COUNT'])
+    return totals.reset_index()
+
+
+def sjoin_lightnings(source=None, forests_path=forests_ext_path, chunk_rows=CHUNK_ROWS, nrows=None):
+    # méthode du notebook (tout en mémoire puis gpd.sjoin), pour contrôle sur un extrait
+    import geopandas as gpd
+    df = pd.concat(read_chunks(source or default_source(), chunk_rows, nrows), ignore_index=True)
+    points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.CENTERLON, df.CENTERLAT), crs="EPSG:4269")
+    forests = gpd.read_file(forests_path, columns=['PROCLAIMED']).to_crs("EPSG:4269")
+    forests['PROCLAIMED'] = forests['PROCLAIMED'].astype(str)
+    joined = gpd.sjoin(points, forests[['PROCLAIMED', 'geometry']], how='left')
+    return lightnings_table(joined.groupby(KEYS)['TOTAL_COUNT'].sum())
+
+
+def write_lightnings(table, path=LIGHTNINGS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    table.to_csv(tmp_path, compression='gzip', index=False)
+    os.replace(tmp_path, path)
+
+
+def peak_memory_mb():
+    # pic de mémoire résidente du processus principal et des processus de calcul (Linux : ko)
+    import resource
+    return {who: resource.getrusage(flag).ru_maxrss / 1024
+            for who, flag in [('principal', resource.RUSAGE_SELF), ('calcul', resource.RUSAGE_CHILDREN)]}
+
+
+if __name__ == "__main__":
+    # python lightning_pipeline.py ingest [nb de processus]   fichiers annuels -> jeu partitionné
+    # python lightning_pipeline.py [build|check] [nb de processus]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    if command == 'ingest':
+        start = time.perf_counter()
+        rows = ingest(workers=workers)
+        for year, count in sorted(rows.items()):
+            print(f"{year} : {count} impacts")
+        print(f"{dataset_dir} : {len(rows)} année(s) ingérée(s) en {time.perf_counter() - start:.1f} s")
+        sys.exit(0)
+    if command == 'check':
+        # extrait du début des données, découpé en petits morceaux, contre gpd.sjoin
+        nrows = 2_000_000
+        table = join_lightnings(workers=workers, chunk_rows=nrows // 8, nrows=nrows)
+        expected = sjoin_lightnings(chunk_rows=nrows // 8, nrows=nrows)
+        same = table.equals(expected)
+        print(f"{len(table)} lignes (forêt, jour) sur {nrows} impacts : "
+              f"{'identique à' if same else 'DIFFÉRENT de'} gpd.sjoin")
+        sys.exit(0 if same else 1)
+    start = time.perf_counter()
+    table = join_lightnings(workers=workers)
+    write_lightnings(table)
+    memory = peak_memory_mb()
+    print(f"{LIGHTNINGS_PATH} : {len(table)} lignes, {table['TOTAL_COUNT'].sum()} impacts, "
+          f"{time.perf_counter() - start:.1f} s, pic mémoire {memory['principal']:.0f} Mo "
+          f"(+ {memory['calcul']:.0f} Mo par processus de calcul)")
@@ -0,0 +1,115 @@
+# model_evaluation.py
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+from model_registry import ARTIFACTS, load_registry
+from sklearn.metrics import (auc, classification_report, confusion_matrix,
+                             precision_recall_curve, roc_curve)
+
+metrics_path = os.path.join('data', 'modeling_metrics.csv')
+
+
+def evaluate(model, forest_df):
+    # une seule inférence sur tout le jeu de la forêt, réutilisée par toutes les figures
+    X = forest_df.drop(columns=['target'])
+    y_true = forest_df['target'].to_numpy()
+
+    proba = model.predict_proba(X)
+    # même règle que model.predict : classe de probabilité maximale
+    y_pred = model.classes_.take(np.argmax(proba, axis=1))
+    y_proba = proba[:, 1]
+
+    fpr, tpr, _ = roc_curve(y_true, y_proba)
+    precision, recall, _ = precision_recall_curve(y_true, y_proba)
+    predictions, counts = np.unique(y_pred, return_counts=True)
+
+    return {
+        'y_true': y_true,
+        'y_pred': y_pred,
+        'y_proba': y_proba,
+        'report': classification_report(y_true, y_pred, output_dict=True),
+        'confusion_matrix': confusion_matrix(y_true, y_pred),
+        'roc': {'fpr': fpr, 'tpr': tpr, 'auc': auc(fpr, tpr)},
+        'pr': {'precision': precision, 'recall': recall, 'auc': auc(recall, precision)},
+        'prediction_counts': dict(zip(predictions.tolist(), counts.tolist())),
+    }
+
+
+def summary_metrics(evaluation):
+    # indicateurs clés d'une évaluation, pour le classement entre forêts
+    report = evaluation['report']
+    fire, no_fire = report.get('1', {}), report.get('0', {})
+    return {
+        'roc_auc': evaluation['roc']['auc'],
+        'pr_auc': evaluation['pr']['auc'],
+        'f1_fire': fire.get('f1-score', 0.0),
+        'f1_no_fire': no_fire.get('f1-score', 0.0),
+        'f1_macro': report['macro avg']['f1-score'],
+        'accuracy': report['accuracy'],
+        'support_fire': int(fire.get('support', 0)),
+        'support_no_fire': int(no_fire.get('support', 0)),
+    }
+
+
+def forest_metrics(forest_name, paths):
+    # données prétraitées et les deux modèles (base et SMOTE) d'une forêt
+    forest_df = pd.read_csv(paths['data'])
+    rows = []
+    for use_smote, kind in [(False, 'base_model'), (True, 'smote_model')]:
+        model = joblib.load(paths[kind])
+        rows.append({'forest': forest_name, 'smote': use_smote, **summary_metrics(evaluate(model, forest_df))})
+    return rows
+
+
+def build_metrics_table(registry, workers=None, forests=None):
+    # évaluation de toutes les forêts (ou de celles données) en parallèle, un processus par cœur
+    forests = registry.forest_names() if forests is None else forests
+    paths = [{kind: registry.path(name, kind) for kind in ARTIFACTS} for name in forests]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(forest_metrics, forests, paths)
+        return pd.DataFrame([row for rows in results for row in rows])
+
+
+def write_metrics(metrics, path=metrics_path):
+    tmp_path = path + '.tmp'
+    metrics.to_csv(tmp_path, index=False, float_format='%.6f')
+    os.replace(tmp_path, path)
+
+
+def stale_forests(metrics, registry):
+    # forêts dont la table a changé depuis l'évaluation (feature_pipeline build / append) :
+    # jours évalués (supports des deux classes) différents du nombre de lignes du registre, ou forêt absente
+    evaluated = metrics.groupby('forest')[['support_fire', 'support_no_fire']].sum().sum(axis=1)
+    return [name for name in registry.forest_names() if evaluated.get(name) != 2 * registry.forests[name]['rows']]
+
+
+def update_metrics(forest_names, registry, path=metrics_path, workers=None):
+    # lignes des forêts données recalculées, les autres gardées
+    forests = [name for name in forest_names if name in registry.forest_names()]
+    metrics = pd.read_csv(path)
+    if forests:
+        metrics = pd.concat([metrics[~metrics['forest'].isin(forests)],
+                             build_metrics_table(registry, workers, forests)])
+        write_metrics(metrics.sort_values(['forest', 'smote'], ignore_index=True), path)
+    return forests
+
+
+if __name__ == "__main__":
+    # python model_evaluation.py [nb de processus]
+    # python model_evaluation.py stale [nb de processus]   seulement les forêts dont la table a changé
+    if len(sys.argv) > 1 and sys.argv[1] == 'stale':
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        start = time.perf_counter()
+        registry = load_registry()
+        forests = update_metrics(stale_forests(pd.read_csv(metrics_path), registry), registry, workers=workers)
+        print(f"{metrics_path} : {len(forests)} forêts réévaluées en {time.perf_counter() - start:.1f} s")
+        sys.exit(0)
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    start = time.perf_counter()
+    metrics = build_metrics_table(load_registry(), workers=workers)
+    write_metrics(metrics)
+    print(f"{metrics_path} ok ({metrics['forest'].nunique()} forêts, {time.perf_counter() - start:.1f} s)")
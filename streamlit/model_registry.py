@@ -0,0 +1,170 @@
+# model_registry.py
+import json
+import os
+import sys
+import threading
+from data_provisioning import data_dir, file_digest, matches_digest, range_digest
+
+registry_path = os.path.join(data_dir, 'model_registry.json')
+forests_path = os.path.join(data_dir, 'forests_with_stations.csv')
+
+# Fichiers produits pour chaque forêt, chemins relatifs au dossier data
+ARTIFACTS = {
+    'data': 'modeling_data/{}_preprocessed.csv',
+    'base_model': 'modeling_data/{}_base_model.pkl',
+    'smote_model': 'modeling_data/{}_smote_model.pkl',
+}
+
+
+class RegistryError(Exception):
+    pass
+
+
+def artifact_entry(relpath, root=data_dir):
+    path = os.path.join(root, relpath)
+    return {'path': relpath, 'size': os.path.getsize(path), 'sha256': file_digest(path)}
+
+
+def appended_entry(entry, root=data_dir):
+    # lignes ajoutées en fin de fichier : seuls les nouveaux octets sont lus, leur empreinte rejoint l'entrée
+    # (liste remise à zéro par feature_pipeline.py build, qui réécrit le fichier)
+    path = os.path.join(root, entry['path'])
+    size = os.path.getsize(path)
+    if size == entry['size']:
+        return entry
+    segment = {'size': size - entry['size'], 'sha256': range_digest(path, entry['size'], size)}
+    return {**entry, 'size': size, 'appended': [*entry.get('appended', []), segment]}
+
+
+def build_registry(root=data_dir, forests_path=forests_path):
+    # inventaire des forêts modélisées : identifiant, fichiers, schéma des variables, nb de lignes
+    import joblib
+    import pandas as pd
+    stations = pd.read_csv(forests_path, index_col=0)
+    forests = {}
+    for name, proclaimed in sorted(zip(stations['FORESTNAME'], stations['PROCLAIMED'])):
+        if not os.path.exists(os.path.join(root, ARTIFACTS['data'].format(name))):
+            continue
+        df = pd.read_csv(os.path.join(root, ARTIFACTS['data'].format(name)))
+        features = {col: str(df[col].dtype) for col in df.columns if col != 'target'}
+        for kind in ('base_model', 'smote_model'):
+            model = joblib.load(os.path.join(root, ARTIFACTS[kind].format(name)))
+            if list(model.feature_names_in_) != list(features):
+                raise RegistryError(f"{name} ({kind}) : variables du modèle différentes des données")
+        forests[name] = {
+            'proclaimed': str(proclaimed),
+            'name': name,
+            'rows': len(df),
+            'features': features,
+            'artifacts': {kind: artifact_entry(pattern.format(name), root) for kind, pattern in ARTIFACTS.items()},
+        }
+    return {'version': 1, 'forests': forests}
+
+
+def write_registry(registry, path=registry_path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, indent=1, ensure_ascii=False)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def update_entries(forest_rows, kind='data', path=registry_path, root=data_dir, replace=False):
+    # fichiers complétés (lignes ajoutées) ou réécrits (replace : empreinte complète, nombres de lignes remplacés) :
+    # entrées mises à jour sans reconstruire le registre
+    with open(path, encoding='utf-8') as f:
+        registry = json.load(f)
+    for name, rows in forest_rows.items():
+        entry = registry['forests'].get(name)
+        if entry is None:
+            continue
+        artifact = entry['artifacts'][kind]
+        entry['artifacts'][kind] = artifact_entry(artifact['path'], root) if replace else appended_entry(artifact, root)
+        entry['rows'] = rows if replace else entry['rows'] + rows
+    write_registry(registry, path)
+
+
+class ModelRegistry:
+    def __init__(self, registry, root=data_dir, built_at=None):
+        self.forests = registry['forests']
+        self.root = root
+        self.built_at = built_at
+        self.by_proclaimed = {entry['proclaimed']: name for name, entry in self.forests.items()}
+        self.problems = {}
+
+    def path(self, forest_name, kind):
+        return os.path.join(self.root, self.forests[forest_name]['artifacts'][kind]['path'])
+
+    def get(self, forest_name):
+        # None si la forêt n'est pas modélisée ou si ses fichiers sont invalides
+        if forest_name in self.problems:
+            return None
+        return self.forests.get(forest_name)
+
+    def forest_names(self):
+        return [name for name in self.forests if name not in self.problems]
+
+    def feature_names(self, forest_name):
+        return list(self.forests[forest_name]['features'])
+
+    def check_artifact(self, entry, deep=False):
+        path = os.path.join(self.root, entry['path'])
+        if not os.path.exists(path):
+            return f"{entry['path']} absent"
+        stat = os.stat(path)
+        if stat.st_size != entry['size']:
+            return f"{entry['path']} : taille différente du registre"
+        # empreinte recalculée seulement pour les fichiers modifiés depuis la construction du registre
+        if deep or self.built_at is None or stat.st_mtime > self.built_at:
+            if not matches_digest(path, entry):
+                return f"{entry['path']} : contenu différent du registre"
+        return None
+
+    def validate(self, deep=False):
+        self.problems = {}
+        for name, entry in self.forests.items():
+            errors = [error for error in (self.check_artifact(artifact, deep) for artifact in entry['artifacts'].values())
+                      if error]
+            if errors:
+                self.problems[name] = errors
+        return self.problems
+
+
+def load_registry(path=registry_path, root=data_dir, deep=False):
+    # registre lu une fois puis confronté aux fichiers présents sur le disque
+    if not os.path.exists(path):
+        raise RegistryError(f"{path} absent : lancer `python model_registry.py build`")
+    with open(path, encoding='utf-8') as f:
+        registry = ModelRegistry(json.load(f), root, built_at=os.path.getmtime(path))
+    registry.validate(deep)
+    return registry
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    # un seul registre par processus, partagé par les onglets et les sessions
+    global _registry
+    with _registry_lock:
+        # relu aussi après une réécriture par feature_pipeline.py (append, build) : tailles et empreintes à jour
+        if _registry is None or (os.path.exists(registry_path)
+                                 and os.path.getmtime(registry_path) != _registry.built_at):
+            _registry = load_registry()
+        elif _registry.problems:
+            # fichiers éventuellement arrivés depuis (téléchargement en arrière-plan)
+            _registry.validate()
+    return _registry
+
+
+if __name__ == "__main__":
+    # python model_registry.py [build|check]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if command == 'build':
+        write_registry(build_registry())
+    registry = load_registry(deep=True)
+    for name, errors in registry.problems.items():
+        print(name, ' ; '.join(errors))
+    print(f"{registry_path} : {len(registry.forest_names())} forêts valides, {len(registry.problems)} en erreur")
+    sys.exit(1 if registry.problems else 0)
@@ -0,0 +1,51 @@
+# partitioned_dataset.py
+# Jeux colonnaires partitionnés par année et par mois (year=AAAA/month=M/part-0.parquet),
+# alimentés fichier annuel par fichier annuel (lightning_pipeline.py, weather_pipeline.py)
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def month_path(year_dir, month):
+    return os.path.join(year_dir, f"month={month}", 'part-0.parquet')
+
+
+def write_year(frames, year, directory, schema, date_column, finish=None):
+    # une année lue par morceaux (frames) ; un fichier parquet par mois, écrit au fil de la lecture ;
+    # finish(chemin) : traitement final de chaque mois, renvoie son nombre de lignes
+    year_dir = os.path.join(directory, f"year={year}")
+    # dossier temporaire ignoré par pyarrow (préfixe '.') tant que l'année n'est pas complète
+    tmp_dir = os.path.join(directory, f".year={year}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    writers = {}
+    rows = 0
+    try:
+        for frame in frames:
+            for month, part in frame.groupby(frame[date_column].dt.month):
+                if month not in writers:
+                    os.makedirs(os.path.dirname(month_path(tmp_dir, month)))
+                    writers[month] = pq.ParquetWriter(month_path(tmp_dir, month), schema)
+                writers[month].write_table(pa.Table.from_pandas(part[schema.names], schema=schema,
+                                                                preserve_index=False))
+            rows += len(frame)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if finish is not None:
+        rows = sum(finish(month_path(tmp_dir, month)) for month in writers)
+    shutil.rmtree(year_dir, ignore_errors=True)
+    os.replace(tmp_dir, year_dir)
+    return rows
+
+
+def ingest_years(ingest_year, paths, directory, workers=None, force=False):
+    # paths : fichier source de chaque année ; une année par processus,
+    # années déjà à jour (partition plus récente que le fichier source) ignorées
+    todo = {year: path for year, path in paths.items()
+            if force or not os.path.isdir(os.path.join(directory, f"year={year}"))
+            or os.path.getmtime(os.path.join(directory, f"year={year}")) < os.path.getmtime(path)}
+    os.makedirs(directory, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(ingest_year, todo.values(), todo, [directory] * len(todo)))
@@ -0,0 +1,93 @@
+# risk_scoring.py
+import numpy as np
+import pandas as pd
+from model_registry import get_registry
+from tree_ensemble import get_store, load_model
+
+TMAX_COLUMNS = ['TMAX_mean', 'TMAX_mean_10D', 'TMAX_mean_30D']
+PRCP_COLUMNS = ['PRCP_mean', 'PRCP_mean_10D', 'PRCP_mean_30D']
+
+
+def feature_history(registry=None):
+    # variables de toutes les forêts modélisées, indexées par (année, jour de l'année, forêt).
+    # float32 : précision à laquelle les arbres comparent les variables, donc sans effet sur les scores
+    registry = registry or get_registry()
+    frames = []
+    for forest_name in registry.forest_names():
+        df = pd.read_csv(registry.path(forest_name, 'data'))
+        df = df.drop(columns=['target']).astype('float32')
+        df['forest'] = forest_name
+        frames.append(df)
+    history = pd.concat(frames, ignore_index=True)
+    history['forest'] = history['forest'].astype('category')
+    history = history.set_index([history['year'].astype('int16'), history['day_of_year'].astype('int16'), 'forest'])
+    history.index.names = ['date_year', 'date_day', 'forest']
+    return history.sort_index()
+
+
+def date_features(history, date):
+    # conditions observées dans chaque forêt à une date (une ligne par forêt, index = nom de forêt)
+    date = pd.Timestamp(date)
+    try:
+        features = history.loc[(date.year, date.dayofyear)]
+    except KeyError:
+        return history.iloc[:0].droplevel(['date_year', 'date_day'])
+    features.index = features.index.astype(str)
+    return features
+
+
+def apply_scenario(features, tmax_offset=0.0, prcp_factor=1.0):
+    # scénario météo : décalage des températures max (°C) et facteur sur les précipitations
+    features = features.copy()
+    features[TMAX_COLUMNS] += tmax_offset
+    features[PRCP_COLUMNS] *= prcp_factor
+    return features
+
+
+def score_forests(features, date=None, use_smote=False):
+    # probabilité de feu pour chaque forêt (index = nom de forêt) en un seul appel vectorisé
+    registry = get_registry()
+    unknown = features.index.difference(registry.forest_names())
+    if len(unknown):
+        raise ValueError(f"Forêt(s) sans modèle valide : {', '.join(unknown)}")
+    kind = 'smote_model' if use_smote else 'base_model'
+    features = features.copy()
+    if date is not None:
+        date = pd.Timestamp(date)
+        features['year'] = date.year
+        features['day_of_year'] = date.dayofyear
+
+    keys = [f"{forest_name}/{kind}" for forest_name in features.index]
+    store = get_store()
+    if store is not None and store.is_current(keys, registry):
+        proba = store.predict_proba_many(keys, features)[:, 1]
+    else:
+        # sans export compact : un modèle par forêt
+        proba = np.array([load_model(forest_name, kind).predict_proba(features.loc[[forest_name]])[0, 1]
+                          for forest_name in features.index])
+
+    return pd.DataFrame({
+        'proclaimed': [registry.forests[forest_name]['proclaimed'] for forest_name in features.index],
+        'probability': proba,
+        # même règle que predict : classe de probabilité maximale
+        'prediction': (proba > 1 - proba).astype('int8'),
+    }, index=features.index.rename('forest'))
+
+
+def sweep_values(series, steps):
+    # grille couvrant les valeurs observées d'une variable ; entiers pour les variables de comptage
+    if (series == series.round()).all():
+        return np.unique(np.round(np.linspace(series.min(), series.max(), steps)))
+    return np.linspace(series.min(), series.max(), steps)
+
+
+def sensitivity_sweep(model, base_row, axes):
+    # probabilité de feu quand une ou deux variables parcourent leur grille (axes : {variable: valeurs}),
+    # les autres restant à base_row : toute la grille en un seul appel au modèle
+    features = list(model.feature_names_in_)
+    grids = np.meshgrid(*axes.values(), indexing='ij')
+    X = np.tile(np.array([base_row[feature] for feature in features], dtype=np.float64), (grids[0].size, 1))
+    for feature, grid in zip(axes, grids):
+        X[:, features.index(feature)] = grid.ravel()
+    proba = model.predict_proba(pd.DataFrame(X, columns=features))[:, 1]
+    return proba.reshape(grids[0].shape)
@@ -0,0 +1,83 @@
+# tab_registry.py
+import ast
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+# Onglets de l'application, dans l'ordre de la barre latérale
+TAB_MODULES = ['introduction', 'wildfires_data', 'weather_data', 'us_forests', 'modeling', 'conclusion']
+
+app_dir = os.path.dirname(os.path.abspath(__file__))
+tabs_dir = os.path.join(app_dir, 'tabs')
+
+
+def read_metadata(module_name):
+    # lire title et sidebar_name sans exécuter le module (ni importer ses dépendances)
+    with open(os.path.join(tabs_dir, f"{module_name}.py"), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    metadata = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            if node.targets[0].id in ('title', 'sidebar_name'):
+                metadata[node.targets[0].id] = ast.literal_eval(node.value)
+    return metadata
+
+
+class LazyTab:
+    # onglet importé seulement à sa première sélection
+    def __init__(self, module_name):
+        self.module_name = module_name
+        metadata = read_metadata(module_name)
+        self.title = metadata.get('title', module_name)
+        self.sidebar_name = metadata.get('sidebar_name', self.title)
+        self.import_seconds = None
+
+    def load(self):
+        module_path = f"tabs.{self.module_name}"
+        if module_path not in sys.modules:
+            start = time.perf_counter()
+            importlib.import_module(module_path)
+            self.import_seconds = time.perf_counter() - start
+        return sys.modules[module_path]
+
+    def run(self):
+        self.load().run()
+
+
+TABS = {tab.sidebar_name: tab for tab in (LazyTab(name) for name in TAB_MODULES)}
+
+
+def import_cost(module_name, top=5):
+    # temps d'import d'un onglet dans un interpréteur neuf (python -X importtime)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import tabs.{module_name}"],
+                            cwd=app_dir, capture_output=True, text=True)
+    total, packages = 0.0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() == f"tabs.{module_name}":
+            total = int(cumulative) / 1e6
+        elif depth == 0:
+            # imports du démarrage de l'interpréteur : ignorés
+            packages = []
+        elif depth == 1:
+            packages.append((int(cumulative) / 1e6, name.strip()))
+    packages.sort(reverse=True)
+    return total, packages[:top]
+
+
+def import_report():
+    print(f"{'onglet':<16} {'import (s)':>10}  principaux imports")
+    for name in TAB_MODULES:
+        total, packages = import_cost(name)
+        heaviest = ', '.join(f"{package} {seconds:.2f}s" for seconds, package in packages)
+        print(f"{name:<16} {total:>10.2f}  {heaviest}")
+
+
+if __name__ == "__main__":
+    # python tab_registry.py : coût d'import de chaque onglet
+    import_report()
@@ -3,46 +3,72 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.ensemble import GradientBoostingClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, confusion_matrix
-from sklearn.datasets import make_classification
-from sklearn.metrics import roc_curve, auc
 import plotly.express as px
 import plotly.graph_objects as go
-from sklearn.metrics import roc_curve, auc
-from sklearn.metrics import precision_recall_curve
-import joblib
 import os
 from datetime import datetime
-import numpy as np
-
-# Chemin vers le répertoire des données prétraitées
-preprocessed_data_dir = r"data/modeling_data"
+from data_visualization import show_data_status
+from model_evaluation import evaluate, metrics_path, stale_forests
+from model_registry import get_registry
+from forest_geodata import get_geometry_store, forests_shape_path, US_EXTENT
+import tree_ensemble
+import risk_scoring
 
 # Fonction pour charger les données prétraitées
 @st.cache_data()
 def load_data(forest_name):
-    file_path = os.path.join(preprocessed_data_dir, f"{forest_name}_preprocessed.csv")
-    return pd.read_csv(file_path)
+    return pd.read_csv(get_registry().path(forest_name, 'data'))
 
 # Fonction pour charger le modèle entraîné
 @st.cache_resource()
 def load_model(forest_name, use_smote):
-    if use_smote:
-        model_path = os.path.join(preprocessed_data_dir, f"{forest_name}_smote_model.pkl")
-    else:
-        model_path = os.path.join(preprocessed_data_dir, f"{forest_name}_base_model.pkl")
-    return joblib.load(model_path)
+    return tree_ensemble.load_model(forest_name, 'smote_model' if use_smote else 'base_model')
+
+# Évaluation complète (prédictions, rapport, courbes) calculée une seule fois par forêt et option SMOTE
+@st.cache_data()
+def load_evaluation(forest_name, use_smote):
+    return evaluate(load_model(forest_name, use_smote), load_data(forest_name))
+
+# Variables de toutes les forêts, pour le calcul du risque national à une date
+@st.cache_resource()
+def load_feature_history():
+    return risk_scoring.feature_history()
+
+# Contours des forêts nationales, au niveau de détail d'une carte des États-Unis
+@st.cache_resource()
+def load_forest_shapes():
+    return get_geometry_store().shapes('forests', extent=US_EXTENT)[['FORESTNAME', 'geometry']]
+
+# Balayage de sensibilité autour d'une ligne de base, gardé en cache par forêt, modèle et ligne de base
+@st.cache_data(max_entries=64)
+def load_sweep(forest_name, use_smote, base_row, sweep_features, steps):
+    forest_df = load_data(forest_name)
+    axes = {feature: risk_scoring.sweep_values(forest_df[feature], steps) for feature in sweep_features}
+    return axes, risk_scoring.sensitivity_sweep(load_model(forest_name, use_smote), base_row, axes)
+
+# Indicateurs de toutes les forêts, calculés hors ligne par model_evaluation.py et tenus à jour
+# par feature_pipeline.py : relus quand le fichier change (version = date de modification)
+@st.cache_data()
+def load_metrics(version):
+    return pd.read_csv(metrics_path)
 
 
 title = "Modeling des incendies dans les forêts nationales"
 sidebar_name = "Modeling"
 
 def run():
+    if not show_data_status('modeling'):
+        return
+
+    problems = get_registry().problems
+    if problems:
+        st.warning(f"{len(problems)} forêt(s) écartée(s), fichiers absents ou modifiés : " + ', '.join(sorted(problems)))
+
     SUBPAGES = {
         "Le modèle": subpage1,
         "Prédiction": subpage2,
+        "Classement des forêts": subpage3,
+        "Risque national": subpage4,
     }
     st.sidebar.title('Prédiction')
     selection = st.sidebar.radio("", list(SUBPAGES.keys()))
@@ -91,15 +117,16 @@ def subpage1():
 
     #Start change 1 
     # Sélectionner la forêt et l'option SMOTE
-    forest_list = [f.rsplit("_preprocessed.csv", 1)[0] for f in os.listdir(preprocessed_data_dir) if f.endswith("preprocessed.csv")]
+    forest_list = get_registry().forest_names()
     selected_forest = st.selectbox("Sélectionnez la forêt", forest_list)
     use_smote = st.checkbox("Utiliser SMOTE", value=False)
 
     # Charger les données prétraitées pour la forêt sélectionnée
     forest_df = load_data(selected_forest)
     
-    # Charger le modèle
+    # Charger le modèle et son évaluation (une seule inférence pour toutes les figures)
     model = load_model(selected_forest, use_smote)
+    evaluation = load_evaluation(selected_forest, use_smote)
 
     # Couleur personnalisée pour les graphiques
     custom_color = '#FF8C00'  # Un ton de beige pour le feu
@@ -218,15 +245,10 @@ def subpage1():
     
     
 
-    # Charger les données de test et les prédictions
-    X_test = forest_df.drop('target', axis=1)
-    y_test = forest_df['target']
-    y_pred = model.predict(X_test)
-
     with col1:
         # Afficher le rapport de classification
         st.subheader("Rapport de Classification")
-        report = classification_report(y_test, y_pred, output_dict=True)
+        report = evaluation['report']
         report_df = pd.DataFrame(report).transpose()
         #st.dataframe(report_df)
         with st.expander("Voir le tableau complet", expanded=True):
@@ -298,9 +320,7 @@ def subpage1():
     col1, col2 = st.columns([1,1])
     
     with col1:
-        y_true = forest_df['target']
-        y_pred = model.predict(forest_df.drop(columns=['target']))
-        cm = confusion_matrix(y_true, y_pred)
+        cm = evaluation['confusion_matrix']
         
         fig = px.imshow(cm, labels=dict(x="Prédit", y="Vrai"), x=['Pas d\'incendie', 'Incendie'], y=['Pas d\'incendie', 'Incendie'], 
                         title='Matrice de Confusion')
@@ -400,10 +420,8 @@ def subpage1():
     col1, col2 = st.columns([1, 1])
     
     with col1:
-        y_true = forest_df['target']
-        y_pred = model.predict_proba(forest_df.drop(columns=['target']))[:, 1]
-        fpr, tpr, _ = roc_curve(y_true, y_pred)
-        roc_auc = auc(fpr, tpr)
+        fpr, tpr = evaluation['roc']['fpr'], evaluation['roc']['tpr']
+        roc_auc = evaluation['roc']['auc']
         
         fig = go.Figure()
         fig.add_trace(go.Scatter(x=fpr, y=tpr, mode='lines', name=f'ROC curve (area = {roc_auc:.2f})', line=dict(color=custom_color, width=2)))
@@ -454,7 +472,7 @@ def subpage1():
     col1, col2 = st.columns([1,1])
     
     with col1:
-        precision, recall, _ = precision_recall_curve(y_true, y_pred)
+        precision, recall = evaluation['pr']['precision'], evaluation['pr']['recall']
     
         fig = px.line(x=recall, y=precision, title='Courbe Precision-Recall', labels={'x': 'Recall', 'y': 'Precision'})
         fig.update_layout(title={'text': '<b>Courbe Precision-Recall</b>', 'x': 0.5, 'xanchor': 'center'})
@@ -514,11 +532,8 @@ def subpage1():
         fig.update_layout(width=600)  # Ajustez la largeur selon vos besoins
         st.plotly_chart(fig)
         '''
-        # Prédictions du modèle
-        predictions = model.predict(forest_df.drop(columns=['target']))
-        
-        # Compter les occurrences des prédictions
-        prediction_counts = pd.Series(predictions).value_counts().sort_index()
+        # Compter les occurrences des prédictions du modèle
+        prediction_counts = pd.Series(evaluation['prediction_counts']).sort_index()
         prediction_counts_df = pd.DataFrame({'Prédiction': prediction_counts.index, 'Nombre': prediction_counts.values})
         
         # Créer un diagramme à barres
@@ -586,7 +601,7 @@ def subpage2():
         )
         
     # Sélectionner la forêt
-    forest_list = [f.rsplit("_preprocessed.csv", 1)[0] for f in os.listdir(preprocessed_data_dir) if f.endswith("preprocessed.csv")]
+    forest_list = get_registry().forest_names()
     selected_forest = st.selectbox("", forest_list)
 
     # Charger les données prétraitées pour la forêt sélectionnée
@@ -687,12 +702,6 @@ def subpage2():
     # Charger le modèle entraîné
     model = load_model(selected_forest, use_smote)
 
-    # Charger les données de test et les prédictions
-    X_test = forest_df.drop('target', axis=1)
-    y_test = forest_df['target']
-    y_pred = model.predict(X_test)
-
-
     # Effectuer la prédiction
     if st.button("Prédire"):
         prediction = model.predict(input_data)
@@ -714,5 +723,162 @@ def subpage2():
                 </style>
                 """, unsafe_allow_html=True)
 
-    
-    
\ No newline at end of file
+    # Analyse de sensibilité
+    st.markdown(
+        """
+        <h4>Analyse de sensibilité</h4>
+        <p>
+        Faites varier une ou deux caractéristiques sur toute leur plage observée, les autres restant aux valeurs saisies ci-dessus, pour visualiser l'évolution de la probabilité de feu et la frontière de décision du modèle (probabilité de 0,5).
+        </p>
+        """,
+        unsafe_allow_html=True
+        )
+
+    sweep_features = st.multiselect(
+        "Caractéristiques à faire varier (deux au maximum)",
+        [feature for feature in features if feature != 'year'],
+        default=['TMAX_mean'],
+        max_selections=2,
+        format_func=feature_translations.get,
+    )
+    if sweep_features:
+        steps = 200 if len(sweep_features) == 1 else 60
+        base_row = {feature: float(value) for feature, value in feature_values.items()}
+        axes, proba = load_sweep(selected_forest, use_smote, base_row, tuple(sweep_features), steps)
+        sensitivity_chart(axes, proba, base_row, feature_translations)
+
+
+def sensitivity_chart(axes, proba, base_row, feature_translations):
+    names = list(axes)
+    if len(names) == 1:
+        x = axes[names[0]]
+        fig = go.Figure(go.Scatter(x=x, y=proba, mode='lines', line=dict(color='#FF8C00', width=2),
+                                   name='Probabilité de feu'))
+        fig.add_hline(y=0.5, line_dash='dash', line_color='gray', annotation_text='Frontière de décision')
+        fig.add_vline(x=base_row[names[0]], line_dash='dot', line_color='black', annotation_text='Valeur saisie')
+        fig.update_layout(xaxis_title=feature_translations[names[0]], yaxis_title='Probabilité de feu',
+                          yaxis_range=[0, 1])
+    else:
+        x, y = axes[names[0]], axes[names[1]]
+        # probabilité en fond, frontière de décision en trait, valeurs saisies en point
+        fig = go.Figure(go.Heatmap(x=x, y=y, z=proba.T, zmin=0, zmax=1, colorscale='YlOrRd',
+                                   colorbar=dict(title='Probabilité')))
+        fig.add_trace(go.Contour(x=x, y=y, z=proba.T, showscale=False, contours_coloring='lines',
+                                 contours=dict(start=0.5, end=0.5, size=1), line=dict(color='black', width=2),
+                                 name='Frontière de décision', hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=[base_row[names[0]]], y=[base_row[names[1]]], mode='markers',
+                                 marker=dict(color='black', size=10, symbol='x'), name='Valeurs saisies'))
+        fig.update_layout(xaxis_title=feature_translations[names[0]], yaxis_title=feature_translations[names[1]])
+    fig.update_layout(title={'text': '<b>Sensibilité de la probabilité de feu</b>', 'x': 0.5, 'xanchor': 'center'},
+                      width=800, height=500)
+    st.plotly_chart(fig)
+
+
+def subpage3():
+    st.header('Classement des forêts selon la performance du modèle')
+    st.markdown("---")
+
+    if not os.path.exists(metrics_path):
+        st.info("Tableau des indicateurs absent : lancer `python model_evaluation.py` pour le construire.")
+        return
+
+    metrics = load_metrics(os.path.getmtime(metrics_path))
+    # tables complétées depuis l'évaluation (feature_pipeline.py append / build) : indicateurs signalés, pas recalculés
+    stale = stale_forests(metrics, get_registry())
+    if stale:
+        st.warning(f"Indicateurs antérieurs aux dernières données pour {len(stale)} forêt(s) "
+                   f"({', '.join(stale[:3])}{'…' if len(stale) > 3 else ''}) : "
+                   "lancer `python model_evaluation.py stale` pour les recalculer.")
+    metric_labels = {
+        'roc_auc': 'AUC ROC',
+        'pr_auc': 'AUC précision-rappel',
+        'f1_fire': 'F1 (incendie)',
+        'f1_macro': 'F1 macro',
+        'accuracy': 'Exactitude',
+    }
+
+    col1, col2 = st.columns(2)
+    with col1:
+        model_choice = st.radio("Modèle", ["Base", "SMOTE", "Les deux"], horizontal=True)
+    with col2:
+        sort_by = st.selectbox("Trier par", list(metric_labels), format_func=metric_labels.get)
+
+    if model_choice != "Les deux":
+        metrics = metrics[metrics['smote'] == (model_choice == "SMOTE")]
+    leaderboard = metrics.sort_values(sort_by, ascending=False).reset_index(drop=True)
+    leaderboard.index += 1
+
+    # Tableau triable (clic sur l'en-tête de colonne)
+    st.dataframe(
+        leaderboard,
+        column_config={
+            'forest': 'Forêt',
+            'smote': st.column_config.CheckboxColumn('SMOTE'),
+            **{name: st.column_config.NumberColumn(label, format="%.3f") for name, label in metric_labels.items()},
+            'f1_no_fire': st.column_config.NumberColumn('F1 (pas d\'incendie)', format="%.3f"),
+            'support_fire': 'Jours avec incendie',
+            'support_no_fire': 'Jours sans incendie',
+        },
+    )
+
+    st.markdown(
+        """
+        Le tableau est calculé hors ligne sur l'ensemble des forêts. L'AUC précision-rappel et le F1 de la classe
+        incendie sont les indicateurs les plus parlants ici : les jours avec incendie sont rares, l'exactitude
+        et l'AUC ROC restent élevées même pour un modèle qui les détecte mal.
+        """)
+
+
+def subpage4():
+    st.header('Risque d\'incendie dans toutes les forêts nationales')
+    st.markdown("---")
+
+    st.markdown(
+        """
+        Le risque est calculé pour toutes les forêts modélisées en une seule fois, à partir des conditions observées
+        à la date choisie. Un scénario météo permet de décaler les températures maximales et de moduler les précipitations.
+        """)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        selected_date = st.date_input("Date", value=datetime(2015, 7, 15),
+                                      min_value=datetime(1992, 1, 1), max_value=datetime(2015, 12, 31))
+        use_smote = st.checkbox("Utiliser SMOTE", value=False, key="national_smote")
+    with col2:
+        tmax_offset = st.slider("Écart de température max (°C)", -10.0, 10.0, 0.0, 0.5)
+    with col3:
+        prcp_factor = st.slider("Facteur sur les précipitations", 0.0, 3.0, 1.0, 0.1)
+
+    features = risk_scoring.date_features(load_feature_history(), selected_date)
+    if features.empty:
+        st.info("Aucune donnée observée pour cette date.")
+        return
+    features = risk_scoring.apply_scenario(features, tmax_offset, prcp_factor)
+    scores = risk_scoring.score_forests(features, date=selected_date, use_smote=use_smote).reset_index()
+
+    st.markdown(f"**{int(scores['prediction'].sum())}** forêts sur {len(scores)} avec un feu prédit le {selected_date:%d/%m/%Y}")
+
+    # Carte du risque sur les contours des forêts
+    if os.path.exists(forests_shape_path):
+        shapes = load_forest_shapes()
+        shapes = shapes[shapes['FORESTNAME'].isin(scores['forest'])]
+        fig = px.choropleth(scores, geojson=shapes.__geo_interface__, featureidkey='properties.FORESTNAME',
+                            locations='forest', color='probability', range_color=[0, 1],
+                            color_continuous_scale='YlOrRd', scope='usa',
+                            hover_data={'proclaimed': True, 'probability': ':.2f'},
+                            labels={'probability': 'Probabilité de feu', 'forest': 'Forêt'})
+        fig.update_layout(title={'text': '<b>Probabilité de feu par forêt nationale</b>', 'x': 0.5, 'xanchor': 'center'},
+                          height=600, margin={'l': 0, 'r': 0, 't': 40, 'b': 0})
+        st.plotly_chart(fig)
+    else:
+        st.info("Contours des forêts indisponibles : carte non affichée.")
+
+    st.dataframe(
+        scores.sort_values('probability', ascending=False).reset_index(drop=True),
+        column_config={
+            'forest': 'Forêt',
+            'proclaimed': 'Identifiant',
+            'probability': st.column_config.ProgressColumn('Probabilité de feu', min_value=0, max_value=1, format="%.2f"),
+            'prediction': 'Feu prédit',
+        },
+    )
@@ -1,12 +1,12 @@
 # us_forests.py
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
 import plotly.express as px
-import contextily as cx
-import gdown
 import os
+from model_registry import get_registry
+from forest_geodata import get_geometry_store, get_station_index, US_EXTENT
+from basemap_cache import forest_map, maps_version
+from feature_pipeline import load_summary, summary_path
 
 title = "Le US Forest Service et les forêts nationales"
 sidebar_name = "USFS et les forêts nationales"
@@ -80,47 +80,26 @@ def nat_forests():
         return df
     
     df_stations = load_stations('data/forests_with_stations.csv')
-    
+
+    registry = get_registry()
+
+    # résumés annuels de toutes les forêts, lus une fois ; version = date du fichier (reconstruit s'il manque)
     @st.cache_data
-    def load_data(path1, path2, path3):
-        df = pd.read_csv(path1,
-                         sep='\t',
-                         header=None,
-                         names=['id_station', 'lat', 'long', 'unk', 'state'],
-                        )
-        df.drop(columns=['unk'], inplace=True)
-        gdf1 = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.long, df.lat), crs="EPSG:4269")
-        
-        gdf2 = gpd.read_file(path2)
-        gdf3 = gpd.read_file(path3)
-        
-        joined_gdf = gpd.sjoin(gdf1, gdf3[['PROCLAIMED', 'geometry']], how='left')
-        filt_joined_gdf = joined_gdf.loc[joined_gdf['PROCLAIMED'].notnull()].drop('index_right', axis=1)
-        
-        return gdf2, gdf3, joined_gdf
-        
-    gdf_forest, gdf_forest_ext, joined_gdf_ext = load_data('data/ghcnd-stations_cleaned.tsv',
-                                                           'data/forests_shape/S_USA.ProclaimedForest.shp',
-                                                           'data/forests_extended_shape_5km/us_forests_ext_d5.shp')
+    def load_yearly_summary(version):
+        return load_summary()
+
+    yearly = load_yearly_summary(os.path.getmtime(summary_path) if os.path.exists(summary_path) else None)
+    
+    # contours des forêts à plusieurs niveaux de détail, partagés par les sessions (forest_geodata)
+    geometry_store = get_geometry_store()
+    gdf_forest = geometry_store.shapes('forests', extent=US_EXTENT)
+    # stations de chaque forêt : index précalculé (forest_geodata), sans jointure spatiale par session
+    station_index = get_station_index()
     
     
     def forest_plotting(forest):
-        # forests polygone
-        polygon_ori = gdf_forest.loc[gdf_forest['FORESTNAME']==forest, 'geometry']
-        polygon_ext = gdf_forest_ext.loc[gdf_forest_ext['FORESTNAME']==forest, 'geometry']
-        polygons = pd.concat([polygon_ext, polygon_ori])
- 
-        # stations point
-        proc = gdf_forest.loc[gdf_forest['FORESTNAME']==forest, 'PROCLAIMED'].to_string(index=False)
-        stations = joined_gdf_ext.loc[joined_gdf_ext['PROCLAIMED']==proc, 'geometry']
-        
-        # plotting
-        base = polygons.plot(figsize=(10,10), color=['greenyellow', 'green'])
-        cx.add_basemap(base, crs="EPSG:4269")
-        stations.plot(ax=base, marker='x', color='black', markersize=50)
-        plt.title(forest)
-        plt.axis('off')
-        st.pyplot(plt)
+        # carte pré-rendue servie depuis le disque (tuiles de fond de carte en cache local, voir basemap_cache)
+        st.image(forest_map(forest, geometry_store, station_index, maps_version(geometry_store, station_index)))
    
     st.markdown(
         """
@@ -147,25 +126,28 @@ def nat_forests():
         nb_stat_ext = df_stations.loc[df_stations['FORESTNAME']==selected_forest, 'nb_stations_ext'].values[0]
         st.markdown(f"**Nb de stations météo :** {nb_stat_ext}, dont {nb_stat} strictement dans la forêt")
         
-        try:
-            # load model dataset
-            model_data_df = pd.read_csv(f'data/modeling_data/{selected_forest}_preprocessed.csv')
+        # résumé annuel de la forêt (forêts modélisées uniquement, d'après le registre)
+        forest_year = None
+        if registry.get(selected_forest) is not None:
+            forest_year = yearly[yearly['forest'] == selected_forest]
         
-            nb_fires = model_data_df['target'].sum()
+            nb_fires = forest_year['target'].sum()
             st.markdown(f"**Nb de départs de feu sur la période :** {nb_fires} soit {nb_fires/24:.1f} par an en moyenne")
-        except FileNotFoundError:
+        else:
             st.markdown(f"**Nb de jours de feu sur la période :** no data available")
-            pass
     
     
     
     with col2:
         forest_plotting(selected_forest)
+
+    if forest_year is None:
+        return
     
     col3, col4 = st.columns(2)
     with col3:
         # figure representing fire days per year
-        fire_year = model_data_df.groupby(by='year', as_index=False).agg({'target':'sum'})
+        fire_year = forest_year[['year', 'target']]
         fig1 = px.bar(fire_year,
                       x='year',
                       y='target',
@@ -186,7 +168,7 @@ def nat_forests():
         st.plotly_chart(fig1)
 
         # figure representing average TMAX by year
-        tmax_year = model_data_df.groupby(by='year', as_index=False).agg({'TMAX_mean':'mean'})
+        tmax_year = forest_year[['year', 'TMAX_mean']]
         fig2 = px.bar(tmax_year,
                       x='year',
                       y='TMAX_mean',
@@ -212,7 +194,7 @@ def nat_forests():
     
     with col4:
         # figure representing lightening days by year
-        light_year = model_data_df.groupby(by='year', as_index=False).agg({'lightnings':'sum'})
+        light_year = forest_year[['year', 'lightnings']]
         fig4 = px.bar(light_year,
                       x='year',
                       y='lightnings',
@@ -236,7 +218,7 @@ def nat_forests():
 
 
         # figure representing sum PRCP by year
-        prcp_year = model_data_df.groupby(by='year', as_index=False).agg({'PRCP_mean':'sum'})
+        prcp_year = forest_year[['year', 'PRCP_mean']]
         fig3 = px.bar(prcp_year,
                       x='year',
                       y='PRCP_mean',
@@ -1,28 +1,42 @@
 # weather_data.py
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-from datetime import datetime
-from pathlib import Path
 import os
-import gdown
+from data_visualization import show_data_status, cached_figure
+from data_provisioning import file_digest
+from data_loading import load_weather
+from data_processing import add_derived_columns, freeze
+from lightning_pipeline import dataset_dir as lightnings_dir, monthly_strikes
 
  
 title = "Les données météo aux Etats-Unis entre 1992 et 2015"
 sidebar_name = "Données météorologiques"
 
-# load datafile from Google drive
-st.cache_data()
+# Fichier récupéré en arrière-plan par data_provisioning (voir data/manifest.json)
 data_dir = r'data'
-os.makedirs(data_dir, exist_ok=True)
-file_id = "1jFHa9crQOSGYLrjy22UzCQ5_sEX5drVX"
 destination = os.path.join(data_dir, "weather_data-state-june24.csv.gz")
 
-# Télécharger le fichier depuis Google Drive s'il n'existe pas déjà
-url="https://drive.google.com/file/d/1Zh3diZn8ycX46zW-xLHrkp4cBZajxO1E/view?usp=share_link"
-if not os.path.exists(destination):
-    #gdown.download(f"https://drive.google.com/drive/u/0/folders/{file_id}", destination, quiet=False)
-    gdown.download(url, destination, quiet=False)
+
+# Charger les données météo une seule fois (copie parquet typée, colonnes utiles uniquement)
+@st.cache_resource()
+def load_data():
+    df = load_weather(destination)
+    df = add_derived_columns(df, 'weather')
+    return freeze(df)
+
+
+# Impacts de foudre par mois, lus dans le jeu partitionné (colonne TOTAL_COUNT seulement) ;
+# version = date de la dernière ingestion
+@st.cache_data()
+def load_monthly_strikes(version):
+    return monthly_strikes(lightnings_dir)
+
+
+# Agrégats annuels par état, partagés par toutes les figures de l'onglet
+@st.cache_data()
+def load_yearstate():
+    df_w = load_data()
+    return df_w.groupby(by=['year', 'state'], as_index=False, observed=True).agg({'TMAX_mean':'mean', 'PRCP_mean':'sum'})
 
 
 def run():
@@ -65,115 +79,10 @@ def run():
             Ces différentes manipulations ont nécessité des ressources importantes afin d'obtenir le jeu de données final.
             """
             )
-                
-        df_w = pd.read_csv(destination, compression='gzip', sep=",", index_col=0)
-        df_w['date'] = pd.to_datetime(df_w['date'], format='%Y%m%d')
-        df_w['year'] = df_w['date'].dt.year
-        df_w['month'] = df_w['date'].dt.month
-        df_w['season'] = df_w['month'] % 12 // 3 + 1
-
-        df_yearstate = df_w.groupby(by=['year', 'state'], as_index=False).agg({'TMAX_mean':'mean', 'PRCP_mean':'sum'})
-        df_yearstate[df_yearstate['state']=='DC']
-        
-        states = sorted(df_yearstate['state'].unique())
-        states_abb = {"Alaska":"AK", "Alabama":"AL", "Arkansas":"AR", "Arizona":"AZ", "California":"CA",
-                      "Colorado":"CO", "Connecticut":"CT", "District of Columbia":"DC", "Delaware":"DE",
-                      "Florida":"FL", "Georgia":"GA", "Hawaii":"HI", "Iowa":"IA", "Idaho":"ID", "Illinois":"IL",
-                      "Indiana":"IN", "Kansas":"KS", "Kentucky":"KY", "Louisiana":"LA", "Massachusetts":"MA",
-                      "Maryland":"MD", "Maine":"ME", "Michigan":"MI", "Minnesota":"MN", "Missouri":"MO",
-                      "Mississippi":"MS", "Montana":"MT", "North Carolina":"NC", "North Dakota":"ND",
-                      "Nebraska":"NE", "New Hampshire":"NH", "New Jersey":"NJ", "New Mexico":"NM", "Nevada":"NV",
-                      "New York":"NY", "Ohio":"OH", "Oklahoma":"OK", "Oregon":"OR", "Pennsylvania":"PA",
-                      "Puerto Rico":"PR", "Rhode Island":"RI", "South Carolina":"SC", "South Dakota":"SD",
-                      "Tennessee":"TN", "Texas":"TX", "Utah":"UT", "Virginia":"VA", "Vermont":"VT", "Washington":"WA",
-                      "Wisconsin":"WI", "West Virginia":"WV", "Wyoming":"WY"}
-
-
-        # choropleths figures
-        fig_t1 = px.choropleth(df_yearstate,
-                               locations='state',
-                               locationmode="USA-states",
-                               color="TMAX_mean",
-                               scope="usa",
-                               color_continuous_scale="YlOrRd",
-                               range_color=[df_yearstate['TMAX_mean'].min(),df_yearstate['TMAX_mean'].max()],
-                               animation_frame='year',
-                              )
-        fig_t1.update_layout(title={'text':f'<b>Température moyenne par état entre 1992 et 2015</b>',
-                                    'font': {'size': 18},
-                                    'x':0.5,
-                                    'xanchor': 'center'},
-                             coloraxis_showscale=False,
-                             height=600,
-                            )
-        
-        fig_p1 = px.scatter_geo(df_yearstate,
-                                locations='state',
-                                scope="usa",
-                                locationmode="USA-states",
-                                size='PRCP_mean',
-                                size_max=20,
-                                animation_frame="year",
-                               )
-
-        fig_t1.add_trace(fig_p1.data[0])
-        for i, frame in enumerate(fig_t1.frames):
-            fig_t1.frames[i].data += (fig_p1.frames[i].data[0],)
-        st.plotly_chart(fig_t1)
-        
-        # bar charts
-        selection_state = st.selectbox('', options=list(states_abb.keys()), index=9)
-        selected_state = states_abb[selection_state]
-        
-        fig_t2 = px.bar(df_yearstate.loc[df_yearstate['state']==selected_state],
-                        x='year',
-                        y='TMAX_mean',
-                        color='TMAX_mean',
-                        range_color=[df_yearstate['TMAX_mean'].min(),df_yearstate['TMAX_mean'].max()],
-                        color_continuous_scale="YlOrRd",
-                       )
-        fig_t2.update_layout(title={'text': f'<b>Température max moyenne par année ({selected_state})</b>',
-                                    'font':{'size':18},
-                                    'x':0.5,
-                                    'xanchor': 'center'},
-                             coloraxis=dict(colorbar_x=0.96, 
-                                            colorbar_y=0.5, 
-                                            colorbar_len=0.5, 
-                                            colorbar_thickness=10,
-                                            colorbar_title=None),
-                             xaxis_title='',
-                             yaxis_title='Temp. max moyenne (°C)',
-                             #height=400,
-                             #width=600
-                            )
-        
-        fig_p2 = px.bar(df_yearstate.loc[df_yearstate['state']==selected_state],
-                        x='year',
-                        y='PRCP_mean',
-                        color='PRCP_mean',
-                        range_color=[df_yearstate['PRCP_mean'].min(),df_yearstate['PRCP_mean'].max()],
-                        color_continuous_scale="Blues",
-                       )
-        fig_p2.update_layout(title={'text': f'<b>Précipitations cumulées par année ({selected_state})</b>',
-                                    'font':{'size':18},
-                                    'x':0.5,
-                                    'xanchor': 'center'},
-                             coloraxis=dict(colorbar_x=0.96, 
-                                            colorbar_y=0.5, 
-                                            colorbar_len=0.5, 
-                                            colorbar_thickness=10,
-                                            colorbar_title=None),
-                             xaxis_title='',
-                             yaxis_title='Précip. cumulées (mm)',
-                             #height=400,
-                             #width=600
-                            )
-        
-        col3, col4 = st.columns(2)
-        with col3:
-            st.plotly_chart(fig_t2, use_container_width=True)
-        with col4:
-            st.plotly_chart(fig_p2, use_container_width=True)
+
+        # Données pas encore disponibles : afficher l'état du téléchargement
+        if show_data_status('weather'):
+            weather_charts()
 
     with dimension_tabs[1]:
         st.header("Impacts de foudre")
@@ -197,3 +106,164 @@ def run():
             Tout comme pour les données météo, la manipulation de ce jeu de données de plus de 70 millions d'enregistrements demande des ressources importantes.
             """
             )
+
+        # Jeu partitionné produit par `python lightning_pipeline.py ingest`
+        if os.path.isdir(lightnings_dir):
+            lightning_charts()
+        else:
+            st.info("Les données de foudre ne sont pas disponibles localement.")
+
+
+def weather_charts():
+    df_yearstate = load_yearstate()
+    df_yearstate[df_yearstate['state']=='DC']
+
+    states = sorted(df_yearstate['state'].unique())
+    states_abb = {"Alaska":"AK", "Alabama":"AL", "Arkansas":"AR", "Arizona":"AZ", "California":"CA",
+                  "Colorado":"CO", "Connecticut":"CT", "District of Columbia":"DC", "Delaware":"DE",
+                  "Florida":"FL", "Georgia":"GA", "Hawaii":"HI", "Iowa":"IA", "Idaho":"ID", "Illinois":"IL",
+                  "Indiana":"IN", "Kansas":"KS", "Kentucky":"KY", "Louisiana":"LA", "Massachusetts":"MA",
+                  "Maryland":"MD", "Maine":"ME", "Michigan":"MI", "Minnesota":"MN", "Missouri":"MO",
+                  "Mississippi":"MS", "Montana":"MT", "North Carolina":"NC", "North Dakota":"ND",
+                  "Nebraska":"NE", "New Hampshire":"NH", "New Jersey":"NJ", "New Mexico":"NM", "Nevada":"NV",
+                  "New York":"NY", "Ohio":"OH", "Oklahoma":"OK", "Oregon":"OR", "Pennsylvania":"PA",
+                  "Puerto Rico":"PR", "Rhode Island":"RI", "South Carolina":"SC", "South Dakota":"SD",
+                  "Tennessee":"TN", "Texas":"TX", "Utah":"UT", "Virginia":"VA", "Vermont":"VT", "Washington":"WA",
+                  "Wisconsin":"WI", "West Virginia":"WV", "Wyoming":"WY"}
+
+
+    # choropleths figures (figure animée servie depuis le cache, reconstruite si les données changent)
+    fig_t1 = cached_figure('weather_tmax_prcp_map', file_digest(destination), {'height': 600},
+                           lambda: temperature_map(df_yearstate))
+    st.plotly_chart(fig_t1)
+
+    # bar charts
+    selection_state = st.selectbox('', options=list(states_abb.keys()), index=9)
+    selected_state = states_abb[selection_state]
+
+    fig_t2 = px.bar(df_yearstate.loc[df_yearstate['state']==selected_state],
+                    x='year',
+                    y='TMAX_mean',
+                    color='TMAX_mean',
+                    range_color=[df_yearstate['TMAX_mean'].min(),df_yearstate['TMAX_mean'].max()],
+                    color_continuous_scale="YlOrRd",
+                   )
+    fig_t2.update_layout(title={'text': f'<b>Température max moyenne par année ({selected_state})</b>',
+                                'font':{'size':18},
+                                'x':0.5,
+                                'xanchor': 'center'},
+                         coloraxis=dict(colorbar_x=0.96, 
+                                        colorbar_y=0.5, 
+                                        colorbar_len=0.5, 
+                                        colorbar_thickness=10,
+                                        colorbar_title=None),
+                         xaxis_title='',
+                         yaxis_title='Temp. max moyenne (°C)',
+                         #height=400,
+                         #width=600
+                        )
+
+    fig_p2 = px.bar(df_yearstate.loc[df_yearstate['state']==selected_state],
+                    x='year',
+                    y='PRCP_mean',
+                    color='PRCP_mean',
+                    range_color=[df_yearstate['PRCP_mean'].min(),df_yearstate['PRCP_mean'].max()],
+                    color_continuous_scale="Blues",
+                   )
+    fig_p2.update_layout(title={'text': f'<b>Précipitations cumulées par année ({selected_state})</b>',
+                                'font':{'size':18},
+                                'x':0.5,
+                                'xanchor': 'center'},
+                         coloraxis=dict(colorbar_x=0.96, 
+                                        colorbar_y=0.5, 
+                                        colorbar_len=0.5, 
+                                        colorbar_thickness=10,
+                                        colorbar_title=None),
+                         xaxis_title='',
+                         yaxis_title='Précip. cumulées (mm)',
+                         #height=400,
+                         #width=600
+                        )
+
+    col3, col4 = st.columns(2)
+    with col3:
+        st.plotly_chart(fig_t2, use_container_width=True)
+    with col4:
+        st.plotly_chart(fig_p2, use_container_width=True)
+
+
+def lightning_charts():
+    df_strikes = load_monthly_strikes(os.path.getmtime(lightnings_dir))
+    df_year = df_strikes.groupby('year', as_index=False)['strikes'].sum()
+    df_month = df_strikes.groupby('month', as_index=False)['strikes'].mean()
+
+    fig_l1 = px.bar(df_year,
+                    x='year',
+                    y='strikes',
+                    color='strikes',
+                    color_continuous_scale="Purples",
+                   )
+    fig_l1.update_layout(title={'text': '<b>Impacts de foudre par année</b>',
+                                'font':{'size':18},
+                                'x':0.5,
+                                'xanchor': 'center'},
+                         coloraxis_showscale=False,
+                         xaxis_title='',
+                         yaxis_title="Nb d'impacts",
+                        )
+
+    fig_l2 = px.bar(df_month,
+                    x='month',
+                    y='strikes',
+                    color='strikes',
+                    color_continuous_scale="Purples",
+                   )
+    fig_l2.update_layout(title={'text': '<b>Impacts de foudre moyens par mois</b>',
+                                'font':{'size':18},
+                                'x':0.5,
+                                'xanchor': 'center'},
+                         coloraxis_showscale=False,
+                         xaxis=dict(tickmode='linear', dtick=1),
+                         xaxis_title='Mois',
+                         yaxis_title="Nb d'impacts",
+                        )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(fig_l1, use_container_width=True)
+    with col2:
+        st.plotly_chart(fig_l2, use_container_width=True)
+
+
+def temperature_map(df_yearstate):
+    # carte animée : température max moyenne (choropleth) et précipitations cumulées (bulles) par état
+    fig_t1 = px.choropleth(df_yearstate,
+                           locations='state',
+                           locationmode="USA-states",
+                           color="TMAX_mean",
+                           scope="usa",
+                           color_continuous_scale="YlOrRd",
+                           range_color=[df_yearstate['TMAX_mean'].min(),df_yearstate['TMAX_mean'].max()],
+                           animation_frame='year',
+                          )
+    fig_t1.update_layout(title={'text':f'<b>Température moyenne par état entre 1992 et 2015</b>',
+                                'font': {'size': 18},
+                                'x':0.5,
+                                'xanchor': 'center'},
+                         coloraxis_showscale=False,
+                         height=600,
+                        )
+
+    fig_p1 = px.scatter_geo(df_yearstate,
+                            locations='state',
+                            scope="usa",
+                            locationmode="USA-states",
+                            size='PRCP_mean',
+                            size_max=20,
+                            animation_frame="year",
+                           )
+
+    fig_t1.add_trace(fig_p1.data[0])
+    for i, frame in enumerate(fig_t1.frames):
+        fig_t1.frames[i].data += (fig_p1.frames[i].data[0],)
+    return fig_t1
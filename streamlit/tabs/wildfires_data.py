@@ -1,13 +1,15 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import geopandas as gpd
 import plotly.express as px
 import plotly.graph_objects as go
-import gdown
 import os
-import statsmodels.api
-import statsmodels.formula.api as smf
+from data_loading import load_wildfires
+from data_provisioning import file_digest, get_provisioner
+from data_visualization import show_data_status
+from data_aggregation import load_cube, load_density_grid, rollup
+from data_processing import add_derived_columns, freeze
+from data_statistics import group_stats, anova_oneway, eta_squared
 
 title = "Les feux de forêt aux États-Unis entre 1992 et 2015"
 sidebar_name = "Données de feux de forêt"
@@ -16,21 +18,52 @@ sidebar_name = "Données de feux de forêt"
 data_dir = r'data'
 os.makedirs(data_dir, exist_ok=True)
 
+# Colonnes utilisées par les différentes vues de l'onglet
+columns = ['FOD_ID', 'FIRE_YEAR', 'DISCO_DATE', 'STAT_CAUSE_DESCR', 'FIRE_SIZE',
+           'LATITUDE', 'LONGITUDE', 'STATENAME', 'GACC_area']
+
+def download_data():
+    # Fichier récupéré en arrière-plan par data_provisioning (voir data/manifest.json)
+    return get_provisioner().require('wildfires')
+
 # Charger les données une seule fois au chargement de l'application
-@st.cache_data()
-def load_data():
-    # URL du fichier Google Drive
-    file_id = '1LnR8--iqjqsk-B15Rcgf-Le4zuo3HqCn'
-    destination = os.path.join(data_dir, 'wildfires15_db.csv')
+# (cache_resource : un seul cadre partagé en lecture seule, sans copie à chaque rerun)
+@st.cache_resource()
+def load_data(columns=None):
+    destination = download_data()
     
-    # Télécharger le fichier depuis Google Drive s'il n'existe pas déjà
-    if not os.path.exists(destination):
-        gdown.download(f"https://drive.google.com/uc?id={file_id}", destination, quiet=False)
+    # Charger les données (copie parquet typée, seulement les colonnes demandées)
+    df = load_wildfires(destination, columns=columns)
     
-    # Charger les données
-    df = pd.read_csv(destination)
+    # Colonnes dérivées (mois, jour de la semaine) calculées une seule fois
+    df = add_derived_columns(df, 'wildfires')
     
-    return df
+    return freeze(df)
+
+# Aperçu et statistiques descriptives calculés une fois par version du fichier source (empreinte),
+# sans parcourir le jeu complet à chaque rerun
+@st.cache_data()
+def load_overview(digest):
+    df = load_data(columns)
+    return df.head(), df.describe()
+
+# Charger le cube d'agrégats (année, mois, jour, état, région GACC, cause)
+@st.cache_data()
+def load_aggregates():
+    destination = download_data()
+    return load_cube(destination)
+
+# Charger la grille de densité des feux (plusieurs tailles de cellule)
+@st.cache_data()
+def load_density():
+    destination = download_data()
+    return load_density_grid(destination)
+
+# Test ANOVA à un facteur à partir des statistiques par groupe (équivalent à anova_lm sur smf.ols)
+@st.cache_data()
+def anova_table(y, term, numeric=False):
+    df = load_data(columns)
+    return anova_oneway(group_stats(df, y, term), term, numeric)
 
 def run():
     # Inclure le lien CDN pour Font Awesome
@@ -90,32 +123,32 @@ def run():
     unsafe_allow_html=True
     )
     
-    # Charger les données
-    df = load_data()
+    # Données pas encore disponibles : afficher l'état du téléchargement
+    if not show_data_status('wildfires'):
+        return
+    
+    # Charger les agrégats et l'aperçu des données
+    cube = load_aggregates()
+    head, description = load_overview(file_digest(download_data()))
     
     # Ajouter un volet pour afficher/masquer les données et les statistiques
     with st.expander("**Afficher/Masquer les données et les statistiques**"):
         # Afficher les premières lignes du dataset
         st.subheader("Aperçu des données")
-        st.write(df.head())
+        st.write(head)
         
         # Statistiques descriptives
         st.subheader("Statistiques descriptives")
-        st.write(df.describe())
+        st.write(description)
     
     # Tabs for different dimensions
     dimension_tabs = st.tabs(["Dimension temporelle", "Dimension spatiale", "Dimension cause des incendies"])
     
     with dimension_tabs[0]:
         st.header("Dimension temporelle")
-        
-        # Charger les données une seule fois au début
-        df = load_data()
 
         # Préparer les données pour le premier graphique
-        df['DISCO_DATE'] = pd.to_datetime(df['DISCO_DATE'])
-        df['MONTH'] = df['DISCO_DATE'].dt.month
-        fire_year_counts = df['FIRE_YEAR'].value_counts().sort_index()
+        fire_year_counts = rollup(cube, 'FIRE_YEAR')['count']
         data = {'Year': fire_year_counts.index, 'Fires': fire_year_counts.values}
         df_plotly = pd.DataFrame(data)
 
@@ -160,7 +193,7 @@ def run():
         st.markdown("Passons maintenant à l'analyse du nombre d'incendies par mois au fil des années.")
 
         # Création du dataframe pour le boxplot
-        df_boxplot = df.groupby(['FIRE_YEAR', 'MONTH']).size().unstack(fill_value=0)
+        df_boxplot = rollup(cube, ['FIRE_YEAR', 'MONTH'])['count'].unstack(fill_value=0)
 
         # Tracer le boxplot avec Plotly
         fig_boxplot = px.box(df_boxplot, color_discrete_sequence=['#FF8C00'])
@@ -192,11 +225,8 @@ def run():
         st.markdown("---")
         st.markdown("Analysons maintenant le nombre d'incendies par jour de la semaine au fil des années.")
 
-        # Extraire le jour de la semaine (0 pour lundi, 1 pour mardi, ..., 6 pour dimanche)
-        df['DAY_OF_WEEK'] = df['DISCO_DATE'].dt.dayofweek
-
-        # Création du dataframe pour le boxplot
-        df_boxplot2 = df.groupby(['FIRE_YEAR', 'DAY_OF_WEEK']).size().unstack(fill_value=0)
+        # Création du dataframe pour le boxplot (jour de la semaine : 0 pour lundi, ..., 6 pour dimanche)
+        df_boxplot2 = rollup(cube, ['FIRE_YEAR', 'DAY_OF_WEEK'])['count'].unstack(fill_value=0)
 
         # Tracer le boxplot avec Plotly
         fig_boxplot2 = px.box(df_boxplot2, color_discrete_sequence=['#FF8C00'])
@@ -229,9 +259,9 @@ def run():
         st.markdown("Analysons maintenant les résultats du test ANOVA entre le mois et le nombre d'incendies.")
 
         # Test ANOVA ('MONTH' <-> Number of fires)
-        result = smf.ols(formula='FOD_ID ~ MONTH', data=df).fit()
-        table = statsmodels.api.stats.anova_lm(result)
+        table = anova_table('FOD_ID', 'MONTH', numeric=True)
         st.write(table)
+        st.caption(f"Taille d'effet (η²) : {eta_squared(table):.4f}")
 
         # Analyse des résultats du test ANOVA
         st.markdown(
@@ -262,7 +292,7 @@ def run():
 
         with col1:
             # Compter le nombre de feux par région GACC
-            count_by_gacc = df.groupby('GACC_area').size()
+            count_by_gacc = rollup(cube, 'GACC_area')['count']
 
             # Trier par ordre décroissant
             count_by_gacc_sorted = count_by_gacc.sort_values(ascending=False)
@@ -288,25 +318,31 @@ def run():
             st.plotly_chart(fig)
 
         with col2:
-          # Convertir en GeoDataFrame
-            gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.LONGITUDE, df.LATITUDE))
-            
-           # Échantillonnage pour réduire la taille des données affichées
-            sample_gdf = gdf.sample(n=10000, random_state=42) if len(gdf) > 10000 else gdf
-
-            # Création de la carte avec Plotly Express
-            fig_map = px.scatter_geo(sample_gdf, lat=sample_gdf.geometry.y, lon=sample_gdf.geometry.x,
+            # Grille de densité précalculée : tous les feux, agrégés par cellule lat/lon
+            grid = load_density()
+            cell_size = st.select_slider("Taille des cellules (degrés)",
+                                         options=sorted(grid['cell_size'].unique(), reverse=True),
+                                         value=0.5)
+            cells = grid.loc[grid['cell_size'] == cell_size]
+
+            # Création de la carte avec Plotly Express (couleur selon le nombre de feux, échelle log)
+            fig_map = px.scatter_geo(cells, lat='lat', lon='lon',
+                                 color=np.log10(cells['count']),
+                                 hover_data={'count': True, 'lat': False, 'lon': False},
+                                 labels={'count': 'Nombre de feux', 'color': 'log10(feux)'},
+                                 color_continuous_scale=['#FFE0B2', '#FF8C00', '#8B0000'],
                                  title='Répartition géographique des feux',
                                  scope='usa',
-                                 opacity=0.6)
+                                 opacity=0.8)
 
-            # Mettre à jour les paramètres de la carte pour un fond transparent et des points orange
+            # Mettre à jour les paramètres de la carte pour un fond transparent et des cellules orange
             fig_map.update_geos(showcountries=False,
                                 showcoastlines=False,
                                 showland=False,
                                 fitbounds="locations")
 
-            fig_map.update_traces(marker=dict(color='#FF8C00', size=5))
+            fig_map.update_traces(marker=dict(symbol='square', size=max(2, int(8 * cell_size))))
+            fig_map.update_layout(coloraxis_showscale=False)
 
             fig_map.update_layout(title={'text':'Répartition géographique des incendies',
                                          'font':{'size':18},
@@ -330,7 +366,7 @@ def run():
         st.markdown("---")
 
         # Compter le nombre de feux par état
-        count_by_state = df.groupby('STATENAME').size()
+        count_by_state = rollup(cube, 'STATENAME')['count']
 
         # Trier par ordre décroissant
         count_by_state_sorted = count_by_state.sort_values(ascending=False)
@@ -366,9 +402,9 @@ def run():
         st.markdown("Analysons maintenant les résultats du test ANOVA entre les régions GACC et le nombre d'incendies.")
 
         # Test ANOVA ('GACC_area' <-> Number of fires)
-        result_gacc = smf.ols(formula='FOD_ID ~ GACC_area', data=df).fit()
-        table_gacc = statsmodels.api.stats.anova_lm(result_gacc)
+        table_gacc = anova_table('FOD_ID', 'GACC_area')
         st.write(table_gacc)
+        st.caption(f"Taille d'effet (η²) : {eta_squared(table_gacc):.4f}")
 
         # Analyse des résultats du test ANOVA pour 'GACC_area'
         st.markdown(
@@ -393,7 +429,7 @@ def run():
         )
 
         # Calcul du nombre d'incendies par cause
-        fires_by_cause = df['STAT_CAUSE_DESCR'].value_counts().sort_values()
+        fires_by_cause = rollup(cube, 'STAT_CAUSE_DESCR')['count'].sort_values()
 
         # Création du graphique avec Plotly en utilisant la palette Turbo
         fig = px.bar(x=fires_by_cause.values,
@@ -424,15 +460,16 @@ def run():
         st.markdown("---")
 
         # Calcul du nombre d'incendies par cause
-        fire_cause = df['STAT_CAUSE_DESCR'].value_counts()
+        fire_cause = rollup(cube, 'STAT_CAUSE_DESCR')['count']
+        nb_fires = cube['count'].sum()
 
         # Filtre des sources d'allumage
         human_induced = ['Equipment Use', 'Smoking', 'Campfire', 'Debris Burning', 'Railroad', 'Arson', 'Children', 'Fireworks', 'Powerline', 'Structure', 'Miscellaneous']
         natural_cause = ['Lightning']
 
         # Calcul du pourcentage des sources d'allumage
-        human_fire = (fire_cause.loc[human_induced].sum() / df.shape[0]) * 100
-        natural_fire = (fire_cause.loc[natural_cause].sum() / df.shape[0]) * 100
+        human_fire = (fire_cause.loc[human_induced].sum() / nb_fires) * 100
+        natural_fire = (fire_cause.loc[natural_cause].sum() / nb_fires) * 100
 
         # Création du graphique avec Plotly
         fig = go.Figure()
@@ -463,7 +500,8 @@ def run():
         st.markdown("---")
 
         # Calcul de la taille moyenne des incendies par cause
-        size_cause = df.groupby('STAT_CAUSE_DESCR')['FIRE_SIZE'].mean().sort_values()
+        size_cause = rollup(cube, 'STAT_CAUSE_DESCR')
+        size_cause = (size_cause['FIRE_SIZE_sum'] / size_cause['FIRE_SIZE_count']).sort_values()
 
         # Création du graphique avec Plotly en utilisant la palette Turbo
         fig = px.bar(x=size_cause.values,
@@ -497,9 +535,9 @@ def run():
         st.markdown("Analysons maintenant les résultats du test ANOVA entre la cause des incendies et leur taille moyenne.")
 
         # Test ANOVA ('STAT_CAUSE_DESCR' <-> Fire size)
-        result_cause_size = smf.ols(formula='FIRE_SIZE ~ STAT_CAUSE_DESCR', data=df).fit()
-        table_cause_size = statsmodels.api.stats.anova_lm(result_cause_size)
+        table_cause_size = anova_table('FIRE_SIZE', 'STAT_CAUSE_DESCR')
         st.write(table_cause_size)
+        st.caption(f"Taille d'effet (η²) : {eta_squared(table_cause_size):.4f}")
 
         # Analyse des résultats du test ANOVA pour 'STAT_CAUSE_DESCR'
         st.markdown(
@@ -0,0 +1,169 @@
+# tests/test_data_provisioning.py
+# python -m unittest discover tests   (depuis le dossier streamlit)
+import hashlib
+import http.server
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from data_provisioning import Provisioner, READY, ERROR
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    # serveur de fichiers local avec prise en charge de l'en-tête Range (reprise des téléchargements)
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        requested = self.headers.get('Range')
+        type(self).requests.append((self.path, requested))
+        if requested:
+            start = int(requested.split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(data) - 1}/{len(data)}")
+            data = data[start:]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ProvisionerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.served = os.path.join(self.tmp, 'served')
+        self.root = os.path.join(self.tmp, 'data')
+        os.makedirs(os.path.join(self.served, 'sub'))
+        os.makedirs(self.root)
+        with open(os.path.join(self.served, 'sub', 'file.bin'), 'wb') as f:
+            f.write(PAYLOAD)
+        RangeHandler.requests = []
+        handler = lambda *args, **kwargs: RangeHandler(*args, directory=self.served, **kwargs)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def manifest(self, sha256=hashlib.sha256(PAYLOAD).hexdigest(), size=len(PAYLOAD), url=None):
+        return {'datasets': {'sample': {'sources': [{'type': 'http', 'url': url or self.url}],
+                                        'files': [{'path': 'sub/file.bin', 'size': size, 'sha256': sha256}]}}}
+
+    def provision(self, manifest, mirror=None):
+        provisioner = Provisioner(manifest, root=self.root, mirror=mirror)
+        provisioner.provision('sample')
+        return provisioner
+
+    def read(self, relpath='sub/file.bin'):
+        with open(os.path.join(self.root, relpath), 'rb') as f:
+            return f.read()
+
+    def test_download_and_checksum(self):
+        provisioner = self.provision(self.manifest())
+        self.assertEqual(provisioner.status['sample']['state'], READY)
+        self.assertEqual(provisioner.status['sample']['done'], len(PAYLOAD))
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'sub', 'file.bin.part')))
+
+    def test_already_present_file_is_not_downloaded(self):
+        self.provision(self.manifest())
+        RangeHandler.requests = []
+        provisioner = self.provision(self.manifest())
+        self.assertEqual(provisioner.status['sample']['state'], READY)
+        self.assertEqual(RangeHandler.requests, [])
+
+    def test_resume_from_partial_file(self):
+        os.makedirs(os.path.join(self.root, 'sub'))
+        with open(os.path.join(self.root, 'sub', 'file.bin.part'), 'wb') as f:
+            f.write(PAYLOAD[:300_000])
+        provisioner = self.provision(self.manifest())
+        self.assertEqual(provisioner.status['sample']['state'], READY)
+        self.assertEqual(RangeHandler.requests, [('/sub/file.bin', 'bytes=300000-')])
+        self.assertEqual(self.read(), PAYLOAD)
+
+    def test_bad_checksum_is_an_error(self):
+        provisioner = self.provision(self.manifest(sha256='0' * 64))
+        self.assertEqual(provisioner.status['sample']['state'], ERROR)
+        self.assertIn('somme de contrôle', provisioner.status['sample']['error'])
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'sub', 'file.bin')))
+
+    def test_unreachable_source_falls_back_to_next(self):
+        manifest = self.manifest()
+        manifest['datasets']['sample']['sources'].insert(0, {'type': 'http', 'url': self.url + '/missing'})
+        provisioner = self.provision(manifest)
+        self.assertEqual(provisioner.status['sample']['state'], READY)
+        self.assertEqual(self.read(), PAYLOAD)
+
+    def test_local_directory_mirror(self):
+        provisioner = self.provision(self.manifest(url=self.url + '/missing'), mirror=self.served)
+        self.assertEqual(provisioner.status['sample']['state'], READY)
+        self.assertEqual(RangeHandler.requests, [])
+        self.assertEqual(self.read(), PAYLOAD)
+
+    def test_unpinned_file_is_pinned_on_first_download(self):
+        self.assertEqual(self.provision(self.manifest(sha256=None, size=None)).status['sample']['state'], READY)
+        with open(os.path.join(self.root, 'cache', 'pins.json'), encoding='utf-8') as f:
+            pins = json.load(f)
+        self.assertEqual(pins['sub/file.bin'], {'size': len(PAYLOAD), 'sha256': hashlib.sha256(PAYLOAD).hexdigest()})
+        # copie locale altérée puis source modifiée : refusée au lieu d'être acceptée sans contrôle
+        with open(os.path.join(self.root, 'sub', 'file.bin'), 'r+b') as f:
+            f.write(b'x')
+        with open(os.path.join(self.served, 'sub', 'file.bin'), 'r+b') as f:
+            f.write(b'x')
+        provisioner = self.provision(self.manifest(sha256=None, size=None))
+        self.assertEqual(provisioner.status['sample']['state'], ERROR)
+
+    def test_registry_backed_dataset(self):
+        with open(os.path.join(self.root, 'model.pkl'), 'wb') as f:
+            f.write(PAYLOAD)
+        registry = {'version': 1, 'forests': {'A': {'artifacts': {'data': {
+            'path': 'model.pkl', 'size': len(PAYLOAD), 'sha256': hashlib.sha256(PAYLOAD).hexdigest()}}}}}
+        with open(os.path.join(self.root, 'model_registry.json'), 'w', encoding='utf-8') as f:
+            json.dump(registry, f)
+        manifest = {'datasets': {'sample': {'sources': [], 'registry': 'model_registry.json'}}}
+        self.assertEqual(self.provision(manifest).status['sample']['state'], READY)
+        with open(os.path.join(self.root, 'model.pkl'), 'ab') as f:
+            f.write(b'x')
+        provisioner = self.provision(manifest)
+        self.assertEqual(provisioner.status['sample']['state'], ERROR)
+        self.assertIn('aucune source', provisioner.status['sample']['error'])
+
+    def test_registry_entry_with_appended_segments(self):
+        # fichier complété sur place : empreinte du début puis de chaque segment ajouté
+        with open(os.path.join(self.root, 'table.csv'), 'wb') as f:
+            f.write(PAYLOAD + b'ajout 1' + b'ajout 2')
+        artifact = {'path': 'table.csv', 'size': len(PAYLOAD) + 14, 'sha256': hashlib.sha256(PAYLOAD).hexdigest(),
+                    'appended': [{'size': 7, 'sha256': hashlib.sha256(b'ajout 1').hexdigest()},
+                                 {'size': 7, 'sha256': hashlib.sha256(b'ajout 2').hexdigest()}]}
+        with open(os.path.join(self.root, 'model_registry.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'forests': {'A': {'artifacts': {'data': artifact}}}}, f)
+        manifest = {'datasets': {'sample': {'sources': [], 'registry': 'model_registry.json'}}}
+        self.assertEqual(self.provision(manifest).status['sample']['state'], READY)
+        with open(os.path.join(self.root, 'table.csv'), 'r+b') as f:
+            f.seek(len(PAYLOAD) + 10)
+            f.write(b'X')
+        self.assertEqual(self.provision(manifest).status['sample']['state'], ERROR)
+
+
+if __name__ == "__main__":
+    unittest.main()
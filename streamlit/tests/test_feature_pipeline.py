@@ -0,0 +1,125 @@
+# tests/test_feature_pipeline.py
+# python -m unittest discover tests   (depuis le dossier streamlit)
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import feature_pipeline
+import model_evaluation
+from data_provisioning import data_dir, matches_digest
+from model_registry import ARTIFACTS, artifact_entry, load_registry, write_registry
+
+# deux forêts de data/forests_with_stations.csv, trois mois d'historique synthétique
+FORESTS = [295435010328, 295380010328]
+START, LAST = '2015-10-01', '2015-12-31'
+
+
+def synthetic_inputs(seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(START, LAST)
+    weather = pd.DataFrame([(forest, day) for forest in FORESTS for day in days], columns=['PROCLAIMED', 'date'])
+    weather['TMAX_mean'] = rng.normal(15, 6, len(weather)).round(1)
+    weather['PRCP_mean'] = rng.exponential(2, len(weather)).round(1)
+    # jours sans météo : lignes écartées des tables, fenêtres de feux comptées sans eux ; dernier jour complet
+    weather = weather[(rng.random(len(weather)) > 0.1) | (weather['date'] == LAST)].reset_index(drop=True)
+    lightnings = weather.loc[rng.random(len(weather)) < 0.2, ['PROCLAIMED', 'date']].rename(columns={'date': '#ZDAY'})
+    fires = weather.loc[np.repeat(np.arange(len(weather)), rng.poisson(0.3, len(weather))), ['PROCLAIMED', 'date']]
+    return weather, lightnings, fires.rename(columns={'date': 'DISCO_DATE'})
+
+
+def read_tree(root):
+    # contenu de tous les fichiers d'un dossier, par chemin
+    contents = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as f:
+                contents[os.path.join(directory, name)] = f.read()
+    return contents
+
+
+class AppendTest(unittest.TestCase):
+    # tables construites jusqu'à la veille de LAST puis complétées d'un jour par append
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmp, 'modeling_data')
+        self.state_path = os.path.join(self.tmp, 'cache', 'feature_state.npz')
+        self.summary_path = os.path.join(self.directory, 'yearly_summary.csv')
+        self.registry_path = os.path.join(self.tmp, 'model_registry.json')
+        os.makedirs(self.directory)
+        weather, lightnings, fires = synthetic_inputs()
+        self.paths = [os.path.join(self.tmp, name) for name in ['weather.csv.gz', 'light.csv.gz', 'fires.csv.gz']]
+        weather.to_csv(self.paths[0])
+        lightnings.to_csv(self.paths[1], index=False)
+        fires.to_csv(self.paths[2], index=False)
+
+        self.names = feature_pipeline.forest_names()
+        self.inputs = feature_pipeline.load_inputs(*self.paths)
+        cutoff = pd.Timestamp(LAST) - pd.Timedelta(days=1)
+        panel = feature_pipeline.build_panel(*self.inputs, start=START, end=cutoff)
+        tables = {self.names[proclaimed]: table for proclaimed, table in feature_pipeline.feature_tables(panel).items()}
+        for name, table in tables.items():
+            feature_pipeline.write_table(table, os.path.join(self.directory, f"{name}_preprocessed.csv"))
+        feature_pipeline.write_table(feature_pipeline.yearly_summary(tables), self.summary_path)
+        feature_pipeline.save_state(feature_pipeline.panel_state(panel), self.state_path)
+        # modèles réels des deux forêts, évalués sur les tables synthétiques (mêmes variables)
+        for name in tables:
+            for kind in ['base_model', 'smote_model']:
+                shutil.copyfile(os.path.join(data_dir, ARTIFACTS[kind].format(name)),
+                                os.path.join(self.tmp, ARTIFACTS[kind].format(name)))
+        write_registry({'version': 1, 'forests': {name: {
+            'proclaimed': str(proclaimed), 'name': name, 'rows': len(tables[name]), 'features': {},
+            'artifacts': {kind: artifact_entry(pattern.format(name), self.tmp) for kind, pattern in ARTIFACTS.items()}}
+            for proclaimed, name in self.names.items() if name in tables}}, self.registry_path)
+        self.metrics = model_evaluation.build_metrics_table(load_registry(self.registry_path, self.tmp), workers=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def append(self):
+        return feature_pipeline.append(self.paths, directory=self.directory, state_path=self.state_path,
+                                       summary_path=self.summary_path, registry_path=self.registry_path)
+
+    def test_append_one_day_matches_full_build(self):
+        appended = self.append()
+        panel = feature_pipeline.build_panel(*self.inputs, start=START, end=LAST)
+        tables = {self.names[proclaimed]: table for proclaimed, table in feature_pipeline.feature_tables(panel).items()}
+        self.assertEqual(appended, {name: 1 for name in tables})
+        with open(self.registry_path, encoding='utf-8') as f:
+            registry = json.load(f)
+        for name, table in tables.items():
+            path = os.path.join(self.directory, f"{name}_preprocessed.csv")
+            pd.testing.assert_frame_equal(pd.read_csv(path), table, check_dtype=False)
+            entry = registry['forests'][name]
+            self.assertEqual(entry['rows'], len(table))
+            # empreinte du segment ajouté seulement, le début du fichier garde celle de la construction
+            self.assertEqual(len(entry['artifacts']['data']['appended']), 1)
+            self.assertTrue(matches_digest(path, entry['artifacts']['data']))
+        pd.testing.assert_frame_equal(pd.read_csv(self.summary_path), feature_pipeline.yearly_summary(tables),
+                                      check_dtype=False)
+        self.assertEqual(feature_pipeline.load_state(self.state_path)['date'], np.datetime64(LAST, 'D'))
+        # indicateurs non recalculés par append, seulement signalés comme antérieurs aux données
+        registry = load_registry(self.registry_path, self.tmp)
+        self.assertEqual(model_evaluation.stale_forests(self.metrics, registry), sorted(tables))
+        self.metrics = model_evaluation.build_metrics_table(registry, workers=1)
+        self.assertEqual(model_evaluation.stale_forests(self.metrics, registry), [])
+        # état à jour : rien de plus à ajouter
+        self.assertEqual(self.append(), {})
+
+    def test_failed_append_leaves_files_unchanged(self):
+        before = read_tree(self.tmp)
+        # échec à la dernière écriture (l'état) : tables déjà complétées sur place, résumé écrit à côté
+        with mock.patch.object(feature_pipeline.np, 'savez', side_effect=OSError('disque plein')):
+            with self.assertRaises(OSError):
+                self.append()
+        self.assertEqual(read_tree(self.tmp), before)
+        self.assertEqual(len(self.append()), len(FORESTS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# tests/test_tree_ensemble.py
+# python -m unittest discover tests   (depuis le dossier streamlit)
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier
+
+import tree_ensemble
+from model_registry import ModelRegistry, artifact_entry, load_registry, registry_path
+
+
+def synthetic_data(rows=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({'year': rng.integers(1992, 2016, rows), 'day_of_year': rng.integers(1, 366, rows),
+                      'TMAX_mean': rng.normal(20, 8, rows), 'PRCP_mean': rng.exponential(3, rows),
+                      'lightnings': rng.integers(0, 2, rows)})
+    y = ((X['TMAX_mean'] > 25) & (X['PRCP_mean'] < 2) | (rng.random(rows) < 0.1)).astype(int)
+    return X, y
+
+
+class CompactModelTest(unittest.TestCase):
+    # export puis rechargement : probabilités identiques au bit près à predict_proba de sklearn
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def export(self, models):
+        # registre minimal : une « forêt » par modèle, fichiers dans un dossier temporaire
+        forests = {}
+        for name, model in models.items():
+            for kind in tree_ensemble.MODEL_KINDS:
+                joblib.dump(model, os.path.join(self.tmp, f"{name}_{kind}.pkl"))
+            forests[name] = {'proclaimed': name, 'name': name, 'rows': 0, 'features': {},
+                             'artifacts': {kind: artifact_entry(f"{name}_{kind}.pkl", self.tmp)
+                                           for kind in tree_ensemble.MODEL_KINDS}}
+        registry = ModelRegistry({'version': 1, 'forests': forests}, root=self.tmp)
+        directory = os.path.join(self.tmp, 'models')
+        tree_ensemble.export_models(registry, directory)
+        return registry, tree_ensemble.ModelStore(directory)
+
+    def test_round_trip_all_depths(self):
+        X, y = synthetic_data()
+        models = {f"depth{depth}": GradientBoostingClassifier(n_estimators=30, max_depth=depth, random_state=0)
+                  .fit(X, y) for depth in [1, 2, 3, 4, 6, tree_ensemble.MAX_DEPTH]}
+        registry, store = self.export(models)
+        X_test, _ = synthetic_data(rows=5000, seed=1)
+        for name, model in models.items():
+            compact = store.get(name, 'base_model', registry.forests[name]['artifacts']['base_model']['sha256'])
+            self.assertIsNotNone(compact, name)
+            # lots de toutes tailles : accumulation unique, plusieurs blocs de CHUNK_ROWS lignes
+            for rows in [1, 7, 300, 5000]:
+                np.testing.assert_array_equal(compact.predict_proba(X_test[:rows]),
+                                              model.predict_proba(X_test[:rows]), err_msg=f"{name}, {rows} lignes")
+            np.testing.assert_array_equal(compact.predict(X_test), model.predict(X_test))
+
+    def test_too_deep_model_is_reported_and_served_by_pickle(self):
+        X, y = synthetic_data()
+        depth = tree_ensemble.MAX_DEPTH + 2
+        model = GradientBoostingClassifier(n_estimators=5, max_depth=depth, random_state=0).fit(X, y)
+        registry, store = self.export({'deep': model})
+        self.assertEqual(tree_ensemble.too_deep(store.index), {'deep/base_model': depth, 'deep/smote_model': depth})
+        self.assertIsNone(store.get('deep', 'base_model'))
+        self.assertFalse(store.is_current(['deep/base_model'], registry))
+
+    def test_stale_export_is_not_served(self):
+        X, y = synthetic_data()
+        registry, store = self.export({'a': GradientBoostingClassifier(n_estimators=5, random_state=0).fit(X, y)})
+        self.assertIsNone(store.get('a', 'base_model', '0' * 64))
+
+
+@unittest.skipUnless(os.path.exists(registry_path), "registre des modèles absent")
+class ForestModelsTest(unittest.TestCase):
+    # modèles des forêts : export des pickles réels comparé sur les données de chaque forêt
+    def test_forest_models_round_trip(self):
+        registry = load_registry()
+        names = registry.forest_names()[:3]
+        with open(registry_path, encoding='utf-8') as f:
+            subset = json.load(f)
+        subset['forests'] = {name: subset['forests'][name] for name in names}
+        registry = ModelRegistry(subset)
+        tmp = tempfile.mkdtemp()
+        try:
+            tree_ensemble.export_models(registry, tmp)
+            self.assertEqual(tree_ensemble.verify(registry, tree_ensemble.ModelStore(tmp)), [])
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
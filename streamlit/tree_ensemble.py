@@ -0,0 +1,424 @@
+# tree_ensemble.py
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+import numpy as np
+from scipy.special import expit
+from data_provisioning import data_dir
+from model_registry import get_registry
+
+store_dir = os.path.join(data_dir, 'cache', 'models')
+
+# Nœuds des arbres à l'export : une colonne par champ, indices globaux sur tous les modèles.
+# Une feuille boucle sur elle-même (enfants = elle-même) : un arbre se complète sans cas particulier.
+NODE_FIELDS = {'feature': '<i4', 'threshold': '<f8', 'children': '<i4', 'value': '<f8'}
+# Format du magasin : tables du moteur de chaque modèle, calculées à l'export et mises bout à bout
+# dans un seul fichier (tables.bin), lues sur place (vues sur le fichier projeté en mémoire)
+STORE_VERSION = 3
+TABLE_FIELDS = {'split_feature': '<i8', 'split_threshold': '<f4', 'slots': '<i8', 'leaf_values': '<f8',
+                'position_feature': '<i8', 'position_threshold': '<f4'}
+# Début de chaque table aligné sur une ligne de cache
+TABLE_ALIGN = 64
+
+# Lignes évaluées à la fois : borne la mémoire des tableaux (arbres x lignes) du calcul
+CHUNK_ROWS = 4096
+# En dessous, la somme des arbres se fait en un seul appel numpy (le coût par appel domine)
+SMALL_BATCH = 256
+
+# Jusqu'à cette profondeur, chemin codé sur un octet (7 positions de décision) et table de feuilles par code ;
+# au-delà, descente niveau par niveau (table de 2**profondeur feuilles par arbre)
+CODE_DEPTH = 3
+# Profondeur maximale servie par le moteur ; modèles plus profonds servis par le pickle (signalés par export/verify)
+MAX_DEPTH = 10
+
+MODEL_KINDS = ['base_model', 'smote_model']
+
+# Tampons de calcul réutilisés d'un appel à l'autre, par fil : sans eux, chaque bloc réalloue
+# quelques Mo que malloc rend au système puis redemande (défauts de page, ~2x plus lent vers 10k lignes)
+_scratch = threading.local()
+
+
+def scratch(name, shape, dtype):
+    # tableau (lignes, colonnes) pris dans le tampon `name` du fil, agrandi si besoin
+    size = shape[0] * shape[1]
+    buffer = _scratch.__dict__.get(name)
+    if buffer is None or buffer.size < size:
+        buffer = _scratch.__dict__[name] = np.empty(size, dtype=dtype)
+    return buffer[:size].reshape(shape)
+
+
+def tree_nodes(tree, offset):
+    # arbre sklearn (tree_) -> colonnes de nœuds, enfants (gauche, droite) décalés de offset
+    ids = np.arange(tree.node_count) + offset
+    leaf = tree.children_left == -1
+    return {
+        'feature': np.where(leaf, 0, tree.feature),
+        'threshold': tree.threshold,
+        'children': np.column_stack([np.where(leaf, ids, tree.children_left + offset),
+                                     np.where(leaf, ids, tree.children_right + offset)]).ravel(),
+        'value': tree.value[:, 0, 0],
+    }
+
+
+def init_raw_prediction(model):
+    # même calcul que sklearn pour la prédiction initiale (probabilité a priori, en log-odds)
+    eps = np.finfo(np.float32).eps
+    proba = np.clip(model.init_.class_prior_, eps, 1 - eps)
+    return float(model._loss.link.link(proba[1:2])[0])
+
+
+def compile_model(nodes, roots, entry):
+    # tables du moteur d'un modèle (voir CompactModel) à partir des nœuds de ses arbres.
+    # Chaque arbre est complété jusqu'à max_depth (ordre en largeur).
+    depth = entry['max_depth']
+    positions = 2 ** depth - 1
+    # nœud à chaque position ; sous une feuille, la feuille elle-même (elle boucle sur elle-même)
+    node_at = np.empty((len(roots), 2 * positions + 1), dtype=np.intp)
+    node_at[:, 0] = roots
+    for position in range(positions):
+        node_at[:, 2 * position + 1] = nodes['children'][2 * node_at[:, position]]
+        node_at[:, 2 * position + 2] = nodes['children'][2 * node_at[:, position] + 1]
+
+    # comparaisons (variable, seuil) distinctes du modèle, faites une seule fois par ligne ;
+    # les positions sans décision pointent vers une comparaison toujours fausse (la dernière)
+    internal = node_at[:, :positions]
+    is_split = nodes['children'][2 * internal] != internal
+    splits, split_ids = np.unique(np.column_stack([nodes['feature'][internal[is_split]],
+                                                   nodes['threshold'][internal[is_split]]]),
+                                  axis=0, return_inverse=True)
+    tables = {'split_feature': splits[:, 0].astype(np.intp)}
+    # x (float32) > seuil (float64) équivaut à x > plus grand float32 <= seuil : comparaison en float32
+    threshold = splits[:, 1].astype(np.float32)
+    tables['split_threshold'] = np.where(threshold > splits[:, 1], np.nextafter(threshold, np.float32(-np.inf)),
+                                         threshold).astype(np.float32)
+    tables['slots'] = np.full(internal.shape, len(splits), dtype=np.intp)
+    tables['slots'][is_split] = split_ids.ravel()
+
+    # valeurs de feuille déjà multipliées par le taux d'apprentissage (même produit que sklearn)
+    leaves = nodes['value'][node_at[:, positions:]] * entry['learning_rate']
+    if depth <= CODE_DEPTH:
+        # valeur de feuille de chaque arbre pour chacun des codes de chemin possibles
+        codes = np.arange(2 ** positions)
+        k = np.zeros((len(roots), len(codes)), dtype=np.intp)
+        for level in range(depth):
+            k = 2 * k + ((codes >> (2 ** level - 1 + k)) & 1)
+        leaves = np.take_along_axis(leaves, k, axis=1)
+    else:
+        # variable et seuil à chaque position, à plat ; positions sans décision : seuil +inf (toujours à gauche)
+        tables['position_feature'] = np.append(tables['split_feature'], 0)[tables['slots']].ravel()
+        tables['position_threshold'] = np.append(tables['split_threshold'],
+                                                 np.float32(np.inf))[tables['slots']].ravel()
+    tables['leaf_values'] = leaves
+    return tables
+
+
+def export_models(registry=None, directory=store_dir):
+    # tables du moteur de tous les modèles de toutes les forêts dans un seul fichier, projetable en mémoire
+    import joblib
+    registry = registry or get_registry()
+    chunks, roots, index, first_trees, offset = [], [], {}, {}, 0
+    for forest_name in registry.forest_names():
+        for kind in MODEL_KINDS:
+            model = joblib.load(registry.path(forest_name, kind))
+            if model.n_classes_ != 2 or model.init_ == 'zero':
+                raise ValueError(f"{forest_name} ({kind}) : modèle non pris en charge")
+            first_trees[f"{forest_name}/{kind}"] = first_tree = len(roots)
+            for estimator in model.estimators_[:, 0]:
+                roots.append(offset)
+                chunks.append(tree_nodes(estimator.tree_, offset))
+                offset += estimator.tree_.node_count
+            index[f"{forest_name}/{kind}"] = {
+                'source_sha256': registry.forests[forest_name]['artifacts'][kind]['sha256'],
+                'n_trees': len(roots) - first_tree,
+                'max_depth': int(max(estimator.tree_.max_depth for estimator in model.estimators_[:, 0])),
+                'init': init_raw_prediction(model),
+                'learning_rate': float(model.learning_rate),
+                'classes': model.classes_.tolist(),
+                'features': model.feature_names_in_.tolist(),
+                'feature_importances': model.feature_importances_.tolist(),
+            }
+    nodes = {field: np.concatenate([chunk[field] for chunk in chunks]).astype(dtype)
+             for field, dtype in NODE_FIELDS.items()}
+    os.makedirs(directory, exist_ok=True)
+    # modèles trop profonds non compilés (servis par le pickle) ; index écrit en dernier :
+    # un export interrompu n'est jamais lu
+    with open(os.path.join(directory, 'tables.bin.tmp'), 'wb') as f:
+        for key, entry in index.items():
+            if entry['max_depth'] > MAX_DEPTH:
+                continue
+            tables = compile_model(nodes, roots[first_trees[key]:first_trees[key] + entry['n_trees']], entry)
+            entry['tables'] = {}
+            for field, table in tables.items():
+                f.write(b'\0' * (-f.tell() % TABLE_ALIGN))
+                entry['tables'][field] = [f.tell(), list(table.shape)]
+                f.write(table.astype(TABLE_FIELDS[field]).tobytes())
+    os.replace(os.path.join(directory, 'tables.bin.tmp'), os.path.join(directory, 'tables.bin'))
+    # fichiers de nœuds du format précédent
+    for name in [*NODE_FIELDS, 'roots']:
+        if os.path.exists(os.path.join(directory, f"{name}.npy")):
+            os.remove(os.path.join(directory, f"{name}.npy"))
+    with open(os.path.join(directory, 'index.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump({'version': STORE_VERSION, 'models': index}, f, ensure_ascii=False)
+    os.replace(os.path.join(directory, 'index.json.tmp'), os.path.join(directory, 'index.json'))
+    return index
+
+
+class CompactModel:
+    # mêmes predict / predict_proba que le GradientBoostingClassifier, tous les arbres évalués ensemble.
+    # Chaque arbre est complété jusqu'à max_depth (ordre en largeur). Jusqu'à CODE_DEPTH, une ligne y suit
+    # un chemin codé sur un octet (bit j = décision à la position j), qui désigne directement la feuille ;
+    # au-delà, la feuille est trouvée en descendant niveau par niveau (plus rapide que sklearn pour les
+    # petits lots seulement : vers 1 000 lignes et plus, le parcours compilé de sklearn reprend l'avantage).
+    def __init__(self, store, entry):
+        self.entry = entry
+        self.init = entry['init']
+        self.learning_rate = entry['learning_rate']
+        self.classes_ = np.asarray(entry['classes'])
+        self.feature_names_in_ = np.asarray(entry['features'], dtype=object)
+        self.n_features_in_ = len(entry['features'])
+        self.feature_importances_ = np.asarray(entry['feature_importances'])
+
+        # tables calculées à l'export (compile_model), lues sans copie dans le fichier projeté du magasin
+        self.depth = entry['max_depth']
+        for field, (offset, shape) in entry['tables'].items():
+            table = np.frombuffer(store.tables, dtype=TABLE_FIELDS[field], count=int(np.prod(shape)), offset=offset)
+            setattr(self, field, table.reshape(shape))
+        trees, positions = self.slots.shape
+        self.leaf_offsets = (np.arange(trees) * self.leaf_values.shape[1])[:, None]
+        self.slot_offsets = (np.arange(trees) * positions)[:, None]
+
+    def _path_codes(self, bits):
+        # code du chemin de chaque ligne dans chaque arbre
+        codes = scratch('codes', (len(self.slots), bits.shape[1]), np.uint8)
+        shifted = scratch('shifted', codes.shape, np.uint8)
+        codes[:] = 0
+        for position in range(self.slots.shape[1]):
+            np.take(bits, self.slots[:, position], axis=0, out=shifted, mode='clip')
+            np.left_shift(shifted, position, out=shifted)
+            np.bitwise_or(codes, shifted, out=codes)
+        return codes
+
+    def _leaf_ranks(self, X):
+        # rang de la feuille atteinte au dernier niveau : une comparaison par arbre, ligne et niveau
+        # (pas de table de toutes les comparaisons, trop grande pour un arbre profond)
+        rows = (np.arange(len(X)) * X.shape[1])[None, :]
+        values = np.ascontiguousarray(X).ravel()
+        k = np.zeros((len(self.slots), len(X)), dtype=np.intp)
+        for level in range(self.depth):
+            position = self.slot_offsets + 2 ** level - 1 + k
+            x = values.take(rows + self.position_feature.take(position))
+            k = 2 * k + (x > self.position_threshold.take(position))
+        return k
+
+    def _decision_chunk(self, X):
+        if self.depth <= CODE_DEPTH:
+            # 1. une ligne de bits par comparaison distincte (+ une ligne de zéros)
+            bits = scratch('bits', (len(self.split_feature) + 1, len(X)), np.uint8)
+            bits[-1] = 0
+            np.greater(np.ascontiguousarray(X.T)[self.split_feature], self.split_threshold[:, None],
+                       out=bits[:-1].view(bool))
+            # 2. feuille atteinte par chaque ligne dans chaque arbre
+            leaves = self._path_codes(bits)
+        else:
+            leaves = self._leaf_ranks(X)
+        # 3. valeurs des feuilles, sommées arbre par arbre dans l'ordre de sklearn
+        index = np.add(leaves, self.leaf_offsets, out=scratch('index', leaves.shape, np.intp))
+        values = self.leaf_values.take(index, out=scratch('values', leaves.shape, np.float64), mode='clip')
+        values[0] += self.init
+        if len(X) <= SMALL_BATCH:
+            # petits lots : une seule accumulation plutôt qu'une addition par arbre
+            return np.add.accumulate(values, axis=0, out=values)[-1]
+        raw = values[0]
+        for tree_values in values[1:]:
+            raw += tree_values
+        return raw
+
+    def decision_function(self, X):
+        X = features_array(X, self.entry['features'])
+        raw = np.empty(len(X))
+        for start in range(0, len(X), CHUNK_ROWS):
+            raw[start:start + CHUNK_ROWS] = self._decision_chunk(X[start:start + CHUNK_ROWS])
+        return raw
+
+    def predict_proba(self, X):
+        proba = expit(self.decision_function(X))
+        return np.column_stack([1 - proba, proba])
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def features_array(X, features):
+    # sklearn compare des float32 aux seuils float64
+    if hasattr(X, 'columns'):
+        X = X[features] if list(X.columns) != features else X
+        return X.to_numpy(dtype=np.float32)
+    return np.asarray(X, dtype=np.float32)
+
+
+class ModelStore:
+    # fichier de tables projeté en mémoire en lecture seule : pages partagées entre modèles et processus
+    def __init__(self, directory=store_dir):
+        with open(os.path.join(directory, 'index.json'), encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') != STORE_VERSION:
+            raise ValueError(f"{directory} : format {index.get('version')}, relancer l'export")
+        self.index = index['models']
+        with open(os.path.join(directory, 'tables.bin'), 'rb') as f:
+            # fichier vide si aucun modèle n'est servi par le moteur (mmap refuse une taille nulle)
+            self.tables = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        # modèles ouverts à la première utilisation
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def is_current(self, keys, registry):
+        # tous les modèles demandés exportés depuis les pickles actuels du registre, et servis par le moteur
+        for key in keys:
+            forest_name, kind = key.rsplit('/', 1)
+            entry = self.index.get(key)
+            if (entry is None or entry['max_depth'] > MAX_DEPTH
+                    or entry['source_sha256'] != registry.forests[forest_name]['artifacts'][kind]['sha256']):
+                return False
+        return True
+
+    def model(self, key):
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = CompactModel(self, self.index[key])
+            return self._models[key]
+
+    def decision_function_many(self, keys, X):
+        # ligne i évaluée par le modèle keys[i] ; les lignes d'un même modèle sont évaluées ensemble
+        features = self.index[keys[0]]['features']
+        if any(self.index[key]['features'] != features for key in keys):
+            raise ValueError("Les modèles n'utilisent pas les mêmes variables")
+        X = features_array(X, features)
+        keys = np.asarray(keys)
+        raw = np.empty(len(keys))
+        for key in dict.fromkeys(keys):
+            rows = np.flatnonzero(keys == key)
+            raw[rows] = self.model(key).decision_function(X[rows])
+        return raw
+
+    def predict_proba_many(self, keys, X):
+        proba = expit(self.decision_function_many(keys, X))
+        return np.column_stack([1 - proba, proba])
+
+    def get(self, forest_name, kind, source_sha256=None):
+        # None si le modèle est absent, trop profond pour le moteur, ou exporté depuis une autre version du pickle
+        entry = self.index.get(f"{forest_name}/{kind}")
+        if (entry is None or entry['max_depth'] > MAX_DEPTH
+                or (source_sha256 is not None and entry['source_sha256'] != source_sha256)):
+            return None
+        return self.model(f"{forest_name}/{kind}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # None tant que l'export n'a pas été fait (python tree_ensemble.py export)
+    global _store
+    with _store_lock:
+        if _store is None and os.path.exists(os.path.join(store_dir, 'index.json')):
+            try:
+                _store = ModelStore()
+            except ValueError:
+                # export d'un format précédent : pickles en attendant le nouvel export
+                return None
+    return _store
+
+
+def load_model(forest_name, kind):
+    # format compact si disponible et à jour, pickle sinon
+    registry = get_registry()
+    store = get_store()
+    if store is not None:
+        model = store.get(forest_name, kind, registry.forests[forest_name]['artifacts'][kind]['sha256'])
+        if model is not None:
+            return model
+    import joblib
+    return joblib.load(registry.path(forest_name, kind))
+
+
+def timed(predict, X, min_seconds=0.2):
+    # durée moyenne d'un appel, répété jusqu'à min_seconds pour les petits lots
+    calls, start = 0, time.perf_counter()
+    while True:
+        predict(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def benchmark(forest_name=None, kind='base_model', sizes=(1, 10, 100, 1000, 10000, 100000, 1000000)):
+    # predict_proba sklearn / moteur compact, sur des lignes tirées des données de la forêt
+    import joblib
+    import pandas as pd
+    registry = get_registry()
+    forest_name = forest_name or registry.forest_names()[0]
+    model = joblib.load(registry.path(forest_name, kind))
+    compact = ModelStore().get(forest_name, kind)
+    data = pd.read_csv(registry.path(forest_name, 'data')).drop(columns=['target'])
+    rng = np.random.default_rng(0)
+    print(f"{forest_name} ({kind})")
+    print(f"{'lignes':>8} {'sklearn (s)':>12} {'compact (s)':>12} {'gain':>6} {'écart max':>10}")
+    for size in sizes:
+        X = data.iloc[rng.integers(0, len(data), size)]
+        gap = np.abs(model.predict_proba(X) - compact.predict_proba(X)).max()
+        sklearn_seconds, compact_seconds = timed(model.predict_proba, X), timed(compact.predict_proba, X)
+        print(f"{size:>8} {sklearn_seconds:>12.6f} {compact_seconds:>12.6f} "
+              f"{sklearn_seconds / compact_seconds:>6.1f} {gap:>10.1e}")
+
+
+def too_deep(index):
+    # modèles exportés mais servis par le pickle, trop profonds pour le moteur
+    return {key: entry['max_depth'] for key, entry in index.items() if entry['max_depth'] > MAX_DEPTH}
+
+
+def verify(registry=None, store=None):
+    # comparaison avec les pickles sur les données de chaque forêt : probabilités identiques au bit près
+    # (modèles trop profonds pour le moteur ignorés ici, voir too_deep)
+    import joblib
+    import pandas as pd
+    registry = registry or get_registry()
+    store = store or ModelStore()
+    deep = too_deep(store.index)
+    failures = []
+    for forest_name in registry.forest_names():
+        X = pd.read_csv(registry.path(forest_name, 'data')).drop(columns=['target'])
+        for kind in MODEL_KINDS:
+            if f"{forest_name}/{kind}" in deep:
+                continue
+            expected = joblib.load(registry.path(forest_name, kind)).predict_proba(X)
+            compact = store.get(forest_name, kind, registry.forests[forest_name]['artifacts'][kind]['sha256'])
+            if compact is None or not np.array_equal(compact.predict_proba(X), expected):
+                failures.append(f"{forest_name} ({kind})")
+    return failures
+
+
+if __name__ == "__main__":
+    # python tree_ensemble.py [export|verify|bench [forêt]]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'verify'
+    if command == 'export':
+        index = export_models()
+        size = os.path.getsize(os.path.join(store_dir, 'tables.bin'))
+        print(f"{store_dir} : {len(index)} modèles, {size / 1e6:.1f} Mo")
+        for key, depth in too_deep(index).items():
+            print(f"{key} : profondeur {depth} > {MAX_DEPTH}, servi par le pickle")
+    elif command == 'bench':
+        benchmark(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        failures = verify()
+        for failure in failures:
+            print('différent :', failure)
+        deep = too_deep(ModelStore().index)
+        for key, depth in deep.items():
+            print(f"{key} : profondeur {depth} > {MAX_DEPTH}, servi par le pickle")
+        print(f"{len(failures)} modèle(s) différent(s) des pickles, {len(deep)} servi(s) par le pickle")
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,106 @@
+# weather_pipeline.py
+import glob
+import os
+import sys
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from data_provisioning import data_dir
+from partitioned_dataset import ingest_years, write_year
+
+# Fichiers journaliers GHCN regroupés par année (https://www.ncei.noaa.gov/pub/data/ghcn/daily/by_year/)
+ghcn_dir = os.path.join(data_dir, 'ghcn')
+GHCN_PATTERN = '{}.csv.gz'
+# Stations américaines et portoricaines retenues (identifiant, latitude, longitude, altitude, état)
+stations_path = os.path.join(data_dir, 'ghcnd-stations_cleaned.tsv')
+# Jeu colonnaire typé, une ligne par (station, jour), partitionné par année et par mois
+dataset_dir = os.path.join(data_dir, 'weather_stations')
+# Moyennes journalières par état (même format que weather_data-state-june24.csv.gz)
+states_path = os.path.join(data_dir, 'weather_data-state.csv.gz')
+
+GHCN_COLUMNS = ['ID', 'DATE', 'ELEMENT', 'DATA_VALUE', 'M_FLAG', 'Q_FLAG', 'S_FLAG', 'OBS_TIME']
+# Éléments extraits, en dixièmes de °C et de mm dans les fichiers GHCN
+ELEMENTS = ['TMIN', 'TMAX', 'TAVG', 'PRCP']
+SCHEMA = pa.schema([('date', pa.date32()), ('station', pa.string()), ('state', pa.string()),
+                    *[(element, pa.float32()) for element in ELEMENTS]])
+
+CHUNK_ROWS = 2_000_000
+
+
+def load_stations(path=stations_path):
+    # état de chaque station, indexé par identifiant (table de hachage pour le filtrage)
+    stations = pd.read_csv(path, sep='\t', header=None, names=['station', 'lat', 'long', 'elevation', 'state'],
+                           usecols=['station', 'state'])
+    return stations.set_index('station')['state']
+
+
+def daily_rows(chunk, stations):
+    # relevés des stations retenues, éléments pivotés en colonnes (une ligne par station et par jour)
+    chunk = chunk[chunk['ELEMENT'].isin(ELEMENTS) & chunk['Q_FLAG'].isna()]
+    codes = stations.index.get_indexer(chunk['ID'])
+    chunk = chunk[codes >= 0]
+    wide = chunk.set_index(['ID', 'DATE', 'ELEMENT'])['DATA_VALUE'].unstack('ELEMENT')
+    wide = (wide.reindex(columns=ELEMENTS) / 10).astype('float32').reset_index()
+    wide.columns.name = None
+    wide['date'] = pd.to_datetime(wide['DATE'].astype(str), format='%Y%m%d')
+    wide['station'] = wide['ID']
+    wide['state'] = stations.to_numpy()[stations.index.get_indexer(wide['ID'])]
+    return wide[SCHEMA.names]
+
+
+def compact_month(path):
+    # relevés d'une même station et d'un même jour répartis sur deux morceaux : lignes fusionnées
+    table = pq.read_table(path).to_pandas(date_as_object=False)
+    if table.duplicated(['station', 'date']).any():
+        table = table.groupby(['station', 'date'], as_index=False, sort=False).first()
+        pq.write_table(pa.Table.from_pandas(table[SCHEMA.names], schema=SCHEMA, preserve_index=False), path)
+    return len(table)
+
+
+def ingest_year(path, year, directory=dataset_dir, stations_path=stations_path):
+    # un fichier annuel lu par morceaux, écrit mois par mois ; doublons entre morceaux fusionnés à la fin
+    stations = load_stations(stations_path)
+    chunks = (daily_rows(chunk, stations)
+              for chunk in pd.read_csv(path, header=None, names=GHCN_COLUMNS,
+                                       usecols=['ID', 'DATE', 'ELEMENT', 'DATA_VALUE', 'Q_FLAG'],
+                                       dtype={'ID': str, 'DATE': 'int32', 'ELEMENT': str, 'DATA_VALUE': 'int32',
+                                              'Q_FLAG': str},
+                                       chunksize=CHUNK_ROWS))
+    return year, write_year(chunks, year, directory, SCHEMA, 'date', finish=compact_month)
+
+
+def ingest(source_dir=ghcn_dir, directory=dataset_dir, workers=None, force=False):
+    paths = {int(os.path.basename(path)[:4]): path
+             for path in sorted(glob.glob(os.path.join(source_dir, GHCN_PATTERN.format('[0-9]' * 4))))}
+    return ingest_years(ingest_year, paths, directory, workers, force)
+
+
+def state_means(directory=dataset_dir):
+    # moyennes journalières des stations par état, partition par partition
+    dataset = ds.dataset(directory, format='parquet', partitioning='hive')
+    frames = []
+    for fragment in dataset.get_fragments():
+        df = fragment.to_table(columns=['date', 'state', *ELEMENTS]).to_pandas(date_as_object=False)
+        frames.append(df.groupby(['date', 'state'], as_index=False)[ELEMENTS].mean())
+    df = pd.concat(frames, ignore_index=True).sort_values(['date', 'state'], ignore_index=True)
+    df['date'] = df['date'].dt.strftime('%Y%m%d').astype('int64')
+    return df.rename(columns={element: f"{element}_mean" for element in ELEMENTS})
+
+
+if __name__ == "__main__":
+    # python weather_pipeline.py ingest [nb de processus]   fichiers annuels GHCN -> jeu partitionné
+    # python weather_pipeline.py states                     moyennes par état pour l'onglet météo
+    command = sys.argv[1] if len(sys.argv) > 1 else 'ingest'
+    start = time.perf_counter()
+    if command == 'states':
+        df = state_means()
+        df.to_csv(states_path, compression='gzip')
+        print(f"{states_path} : {len(df)} lignes en {time.perf_counter() - start:.1f} s")
+        sys.exit(0)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    rows = ingest(workers=workers)
+    for year, count in sorted(rows.items()):
+        print(f"{year} : {count} relevés journaliers")
+    print(f"{dataset_dir} : {len(rows)} année(s) ingérée(s) en {time.perf_counter() - start:.1f} s")